@@ -132,6 +132,7 @@ const QuizEmployee = () => {
   const [historyError, setHistoryError] = useState("");
   const [selectedAttempt, setSelectedAttempt] = useState(null);
   const [attemptDetail, setAttemptDetail] = useState(null);
+  const [attemptEvals, setAttemptEvals] = useState({});
   const [selectedAttemptNumber, setSelectedAttemptNumber] = useState(null);
   const [showHistory, setShowHistory] = useState(false);
 
@@ -283,16 +284,37 @@ const QuizEmployee = () => {
           attemptNumberToSelect = data.length - idx;
         }
       }
+      const evalsByAttempt = await fetchAttemptEvaluations(data.map(a => a.id));
       setSelectedAttempt(attemptIdToSelect);
       setSelectedAttemptNumber(attemptNumberToSelect);
-      if (attemptIdToSelect) fetchAttemptDetail(attemptIdToSelect, attemptNumberToSelect);
+      if (attemptIdToSelect) fetchAttemptDetail(attemptIdToSelect, attemptNumberToSelect, evalsByAttempt);
     } catch (err) {
       setHistoryError(err.message || "Error loading history.");
       setHistory([]);
     }
   }
 
-  async function fetchAttemptDetail(attemptId, attemptNumber = null) {
+  // Loads the evaluations of every listed attempt in a single request
+  async function fetchAttemptEvaluations(attemptIds) {
+    if (!attemptIds.length) return {};
+    try {
+      const params = attemptIds.map(id => `attempt_ids=${encodeURIComponent(id)}`).join("&");
+      const resp = await fetch(`${getBaseURL()}/assessment1/quiz/attempt/evaluations?${params}`);
+      const data = await resp.json();
+      if (data.detail) throw new Error(data.detail);
+      setAttemptEvals(data);
+      return data;
+    } catch (err) {
+      setAttemptEvals({});
+      return {};
+    }
+  }
+
+  async function fetchAttemptDetail(attemptId, attemptNumber = null, evalsByAttempt = attemptEvals) {
+    if (evalsByAttempt[attemptId]) {
+      setAttemptDetail({ evals: evalsByAttempt[attemptId], attemptNumber });
+      return;
+    }
     try {
       const resp = await fetch(`${getBaseURL()}/assessment1/quiz/attempt/${attemptId}/evaluations`);
       const evals = await resp.json();
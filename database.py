@@ -1,15 +1,267 @@
 import os
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import declarative_base, sessionmaker
+import re
+import sys
+import json
+import time
+import logging
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Read replica for read-only endpoints; reads go to the primary when unset.
+# Replica reads may lag the primary by the replication delay.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+# Pool settings, applied to the primary and the replica engine separately
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds before a pooled connection is replaced; keep below server and proxy idle timeouts
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Prepared statements asyncpg caches per connection; set 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+# Server-side statement_timeout in milliseconds for each engine's sessions (0 disables)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_READ_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_READ_STATEMENT_TIMEOUT_MS", "10000"))
+
+# Query guard: "off", "log" (staging: warn with code locations) or "raise" (tests)
+QUERY_GUARD_MODE = os.getenv("QUERY_GUARD_MODE", "off").lower()
+# Times one statement shape may run in a request before it is flagged as a likely N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+# Statement budgets of routes whose count must not grow with the size of the
+# request or its result; tests run with QUERY_GUARD_MODE=raise against them.
+# /quiz/evaluate/ covers one answering user (the rollup runs per user).
+DEFAULT_QUERY_BUDGETS: Dict[str, int] = {
+    "/quiz/evaluate/": 8,
+    "/quiz/attempt/evaluations": 1,
+    "/quiz/attempt/{attempt_id}/evaluations": 1,
+    "/quiz/attempts/{user_id}": 1,
+    "/stats/user/{user_id}": 1,
+}
+# Overrides and additions per route template as JSON, e.g. {"/quiz/evaluate/": 6}
+QUERY_BUDGETS: Dict[str, int] = {**DEFAULT_QUERY_BUDGETS, **json.loads(os.getenv("QUERY_BUDGETS", "{}"))}
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def _create_engine(url: str, statement_timeout_ms: int, role: str) -> AsyncEngine:
+    server_settings = {"application_name": f"quiz-backend-{role}"}
+    if statement_timeout_ms:
+        server_settings["statement_timeout"] = str(statement_timeout_ms)
+    return create_async_engine(
+        url,
+        echo=False,
+        future=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={"statement_cache_size": DB_STATEMENT_CACHE_SIZE, "server_settings": server_settings},
+    )
 
 Base = declarative_base()
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+engine = _create_engine(DATABASE_URL, DB_STATEMENT_TIMEOUT_MS, "primary")
+read_engine = (
+    _create_engine(DATABASE_READ_URL, DB_READ_STATEMENT_TIMEOUT_MS, "replica")
+    if DATABASE_READ_URL else engine
+)
+# Engines by role, for instrumentation, pool metrics and shutdown
+engines: Dict[str, AsyncEngine] = {"primary": engine}
+if read_engine is not engine:
+    engines["replica"] = read_engine
+
+# Writes, and reads that must see them, use AsyncSessionLocal. Read-only
+# endpoints that tolerate replication lag use ReadSessionLocal.
 AsyncSessionLocal = sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+ReadSessionLocal = sessionmaker(bind=read_engine, expire_on_commit=False, class_=AsyncSession)
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    # Per-session override of the engine's statement_timeout, e.g.
+    #     AsyncSessionLocal(info={"statement_timeout": 120_000})
+    # SET LOCAL lasts until the transaction ends
+    timeout_ms = session.info.get("statement_timeout")
+    if timeout_ms is not None:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+_BIND_PARAM = re.compile(r"\$\d+|%\(\w+\)s|\?")
+_PARAM_LIST = re.compile(r"\?(\s*,\s*\?)+")
+_ROW_LIST = re.compile(r"\(\?\.\.\.\)(\s*,\s*\(\?\.\.\.\))+|\(\?\)(\s*,\s*\(\?\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+class QueryGuardError(RuntimeError):
+    pass
+
+def statement_shape(statement: str) -> str:
+    # Collapses bound parameters, IN lists and multi-row VALUES so the same
+    # query issued with different values or list lengths has one shape
+    shape = _BIND_PARAM.sub("?", _WHITESPACE.sub(" ", statement.strip()))
+    shape = _PARAM_LIST.sub("?...", shape)
+    return _ROW_LIST.sub("(?...)...", shape)
+
+def _caller_location() -> str:
+    # Statements run in a greenlet under the async session; the awaiting
+    # coroutine chain hangs off the parent greenlet's suspended frame
+    frame = sys._getframe(1)
+    try:
+        import greenlet
+        parent = greenlet.getcurrent().parent
+        if parent is not None and parent.gr_frame is not None:
+            frame = parent.gr_frame
+    except ImportError:
+        pass
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_ROOT) and filename != __file__ and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+class QueryCounter:
+    # Counts are added to every enclosing counter, so a test's query_budget()
+    # still sees statements run under the per-request counter
+    def __init__(self, parent: Optional["QueryCounter"] = None, detailed: bool = False):
+        self.parent = parent
+        self.count = 0
+        self.seconds = 0.0
+        # Shapes and locations are only collected while the guard is in use
+        self.detailed = detailed or QUERY_GUARD_MODE != "off" or bool(parent and parent.detailed)
+        self.shapes: Counter = Counter()
+        self.locations: Dict[str, Counter] = defaultdict(Counter)
+
+    def _chain(self):
+        counter = self
+        while counter is not None:
+            yield counter
+            counter = counter.parent
+
+    def record(self, shape: Optional[str], location: Optional[str]):
+        for counter in self._chain():
+            counter.count += 1
+            if shape is not None:
+                counter.shapes[shape] += 1
+                counter.locations[shape][location] += 1
+
+    def add_time(self, seconds: float):
+        for counter in self._chain():
+            counter.seconds += seconds
+
+    def by_location(self) -> Counter:
+        totals: Counter = Counter()
+        for locations in self.locations.values():
+            totals.update(locations)
+        return totals
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[Tuple[str, int, Counter]]:
+        return [
+            (shape, count, self.locations[shape])
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+# Counter for the request being handled, set by start_query_count()
+_query_counter: contextvars.ContextVar = contextvars.ContextVar("query_counter", default=None)
+
+def start_query_count(detailed: bool = False) -> QueryCounter:
+    # Statements executed from this context onwards, including tasks it
+    # spawns, are added to the returned counter
+    counter = QueryCounter(_query_counter.get(), detailed)
+    _query_counter.set(counter)
+    return counter
+
+def current_query_counter() -> Optional[QueryCounter]:
+    return _query_counter.get()
+
+def set_query_budget(route: str, max_statements: Optional[int]):
+    if max_statements is None:
+        QUERY_BUDGETS.pop(route, None)
+    else:
+        QUERY_BUDGETS[route] = max_statements
+
+def check_query_guard(
+    counter: QueryCounter,
+    label: str,
+    budget: Optional[int] = None,
+    mode: str = QUERY_GUARD_MODE
+) -> List[str]:
+    # Flags a statement count over budget (by default the route's entry in
+    # QUERY_BUDGETS) and statement shapes repeated QUERY_REPEAT_THRESHOLD or
+    # more times. Logs them in "log" mode and raises QueryGuardError in "raise" mode.
+    if mode == "off":
+        return []
+    problems = []
+    budget = budget if budget is not None else QUERY_BUDGETS.get(label)
+    if budget is not None and counter.count > budget:
+        top = ", ".join(f"{location} ({n}x)" for location, n in counter.by_location().most_common(5))
+        problems.append(f"{label} ran {counter.count} SQL statements, over its budget of {budget}; top locations: {top}")
+    for shape, count, locations in counter.repeated():
+        where = ", ".join(f"{location} ({n}x)" for location, n in locations.most_common(3))
+        problems.append(f"{label} likely N+1: {count}x {shape[:200]} from {where}")
+    if problems:
+        if mode == "raise":
+            raise QueryGuardError("\n".join(problems))
+        for problem in problems:
+            logger.warning(problem)
+    return problems
+
+@contextmanager
+def query_budget(max_statements: int, label: str = "block"):
+    # For tests: raises QueryGuardError if the block runs more than
+    # max_statements statements or repeats one shape too often, e.g.
+    #     with query_budget(6, "/quiz/evaluate/"):
+    #         await client.post("/quiz/evaluate/", json=payload)
+    counter = QueryCounter(_query_counter.get(), detailed=True)
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+    check_query_guard(counter, label, budget=max_statements, mode="raise")
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    if counter is not None:
+        if counter.detailed:
+            counter.record(statement_shape(statement), _caller_location())
+        else:
+            counter.record(None, None)
+        # On the execution context, which is discarded with the statement
+        # whether or not it succeeds
+        if context is not None:
+            context._query_started = time.perf_counter()
+
+def _stop_timing(context):
+    started = getattr(context, "_query_started", None)
+    counter = _query_counter.get()
+    if started is not None:
+        context._query_started = None
+        if counter is not None:
+            counter.add_time(time.perf_counter() - started)
+
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    _stop_timing(context)
+
+def _time_failed_statement(exception_context):
+    # Failed statements (timeouts, constraint violations) took database time too
+    _stop_timing(exception_context.execution_context)
+
+for _engine in engines.values():
+    event.listen(_engine.sync_engine, "before_cursor_execute", _count_statement)
+    event.listen(_engine.sync_engine, "after_cursor_execute", _time_statement)
+    event.listen(_engine.sync_engine, "handle_error", _time_failed_statement)
 
 # Import this if you have a database connection from another module
 try:
@@ -1,33 +1,43 @@
 import os
+import time
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Optional
 from datetime import datetime
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.future import select as async_select
-from sqlalchemy import func
 
-from database import engine, Base, AsyncSessionLocal
-from models import QuestionORM, QuizAttemptORM, EvaluationORM
+from database import (
+    engine, engines, Base, AsyncSessionLocal, ReadSessionLocal, start_query_count, check_query_guard
+)
+from models import QuestionORM, QuizAttemptORM, UserStatsORM
 from schemas import *
 from services.question_service import (
-    get_recent_question_texts, validate_and_retry_llm_call,
-    validate_mcq_batch, validate_subjective_batch,
-    save_mcq_questions_to_db, save_subjective_questions_to_db,
-    get_quiz_questions, get_managerial_ratios
+    generate_questions, get_quiz_questions, get_managerial_ratios, stream_generated_questions
 )
+from services.generation_jobs import generation_jobs
 from services.evaluation_service import (
-    evaluate_mcq_answer, evaluate_subjective_answer, save_evaluation_to_db
+    grade_answers, save_evaluations_to_db, get_attempt_evaluation_results
 )
-from utils.helpers import build_enhanced_prompt
+from services.stats_service import user_stats_response
+from services.evaluation_cache import evaluation_cache, EVALUATION_CACHE_ENABLED
+from services.question_bank_cache import question_bank_cache, QUESTION_BANK_CACHE_ENABLED
+from services.reference_data import reference_data, REFERENCE_DATA_CACHE_ENABLED
+from services.similarity_index import question_similarity_index, QUESTION_SIMILARITY_ENABLED
+from services.llm_service import init_llm_client, close_llm_client, llm_gateway
+from services import metrics, tracing
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+if tracing.TRACING_ENABLED:
+    tracing.install_log_filter()
+    tracing.instrument_sqlalchemy(*engines.values())
+
 # FastAPI App
 app = FastAPI(title="Quiz Backend with Evaluation", version="2.2.0")
 app.add_middleware(
@@ -38,6 +48,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Report the number of SQL statements each request ran, for load tests and profiling
+DB_QUERY_COUNT_HEADER = os.getenv("DB_QUERY_COUNT_HEADER", "false").lower() in ("1", "true", "yes")
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    counter = start_query_count()
+    started = time.perf_counter()
+    with tracing.trace(f"{request.method} {request.url.path}", **{"http.method": request.method}) as root:
+        response = await call_next(request)
+        # Label by route template, not the raw path, to keep label cardinality bounded
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        root.set("http.route", route_path)
+        root.set("http.status_code", response.status_code)
+        root.set("db.statement_count", counter.count)
+    if root.trace is not None:
+        response.headers["X-Trace-Id"] = root.trace.trace_id
+    metrics.http_request_duration.observe(
+        time.perf_counter() - started, method=request.method, route=route_path, status=response.status_code
+    )
+    metrics.db_statements_per_request.observe(counter.count, route=route_path)
+    metrics.db_time_per_request.observe(counter.seconds, route=route_path)
+    # Statement budgets and N+1 detection; logs or raises per QUERY_GUARD_MODE
+    check_query_guard(counter, route_path)
+    if DB_QUERY_COUNT_HEADER:
+        response.headers["X-DB-Queries"] = str(counter.count)
+    return response
+
+metrics.Gauge(
+    "question_bank_questions", "Questions in the bank by type, from the question bank cache index", ("type",),
+    callback=lambda: question_bank_cache.counts_by_type()
+)
+metrics.Gauge(
+    "llm_concurrency_limit", "Current adaptive concurrency limit per LLM backend", ("backend",),
+    callback=lambda: {(b.name,): int(b.limiter.limit) for b in llm_gateway.backends}
+)
+metrics.Gauge(
+    "llm_in_flight", "LLM calls in flight per backend", ("backend",),
+    callback=lambda: {(b.name,): b.limiter.in_flight for b in llm_gateway.backends}
+)
+metrics.Gauge(
+    "db_pool_connections_in_use", "Pooled connections checked out per database engine", ("engine",),
+    callback=lambda: {(role,): e.sync_engine.pool.checkedout() for role, e in engines.items()}
+)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
@@ -47,10 +102,27 @@ async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     logger.info("Connected to the database on startup")
+    await init_llm_client()
+    if EVALUATION_CACHE_ENABLED:
+        await evaluation_cache.start()
+    if REFERENCE_DATA_CACHE_ENABLED:
+        await reference_data.start()
+    if QUESTION_BANK_CACHE_ENABLED:
+        await question_bank_cache.load_index()
+    if QUESTION_SIMILARITY_ENABLED:
+        await question_similarity_index.start()
+    await generation_jobs.start()
 
 @app.on_event("shutdown")
 async def shutdown():
-    await engine.dispose()
+    await generation_jobs.stop()
+    await reference_data.stop()
+    await evaluation_cache.stop()
+    await question_similarity_index.stop()
+    await close_llm_client()
+    await tracing.shutdown()
+    for e in engines.values():
+        await e.dispose()
     logger.info("Disconnected from the database on shutdown")
 
 @app.get("/", response_class=HTMLResponse)
@@ -65,45 +137,7 @@ async def quiz_page(request: Request):
 @app.post("/generate_questions_batch/", response_model=List[QuestionOut])
 async def generate_questions_batch(request: QuestionBatchRequest):
     try:
-        recent = await get_recent_question_texts(
-            request.topic, request.skill_type.value, request.managerial_level, n=15
-        )
-        
-        prompt = build_enhanced_prompt(
-            request.topic, 
-            request.difficulty.value, 
-            request.skill_type.value, 
-            request.managerial_level,
-            request.num_questions, 
-            request.question_type.value, 
-            avoid_questions=recent
-        )
-        
-        batch = await validate_and_retry_llm_call(
-            prompt, 
-            max_retries=3,
-            question_type=request.question_type.value
-        )
-        
-        if request.question_type == QuestionType.mcq:
-            valid_qs = validate_mcq_batch(batch)
-            if not valid_qs:
-                raise HTTPException(
-                    status_code=500, 
-                    detail="No valid MCQ questions could be generated. Please try again."
-                )
-            created = await save_mcq_questions_to_db(valid_qs, request)
-        else:
-            valid_qs = validate_subjective_batch(batch)
-            if not valid_qs:
-                raise HTTPException(
-                    status_code=500, 
-                    detail="No valid subjective questions could be generated. Please try again."
-                )
-            created = await save_subjective_questions_to_db(valid_qs, request)
-        
-        logger.info(f"Successfully generated {len(created)} questions")
-        return created
+        return await generate_questions(request)
     except HTTPException:
         raise
     except Exception as e:
@@ -113,6 +147,25 @@ async def generate_questions_batch(request: QuestionBatchRequest):
             detail=f"Failed to generate questions: {str(e)}"
         )
 
+@app.post("/generate_questions_batch/jobs/", response_model=GenerationJobOut, status_code=202)
+async def submit_generation_job(request: QuestionBatchRequest):
+    return await generation_jobs.submit(request)
+
+@app.get("/generate_questions_batch/jobs/{job_id}", response_model=GenerationJobOut)
+async def get_generation_job(job_id: str):
+    job = await generation_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    return job
+
+@app.post("/generate_questions_batch/stream/")
+async def generate_questions_batch_stream(request: QuestionBatchRequest):
+    return StreamingResponse(
+        stream_generated_questions(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/questions/", response_model=List[QuestionOut])
 async def list_questions(
     topic: Optional[str] = None,
@@ -136,178 +189,83 @@ async def list_questions(
     
     query = query.order_by(QuestionORM.created_at.desc()).limit(limit)
     
-    async with AsyncSessionLocal() as session:
+    async with ReadSessionLocal() as session:
         result = await session.execute(query)
         return result.scalars().all()
 
-# Quiz Endpoints - FIXED: Added randomization
+# Quiz Endpoints
 @app.post("/quiz/start/", response_model=List[QuestionForEvaluation])
 async def start_quiz(request: QuizRequest):
-    logger.info(f"Starting quiz with {request.num_questions} questions")
-    
-    if request.managerial_level:
-        ratios = await get_managerial_ratios(request.managerial_level)
-        if ratios:
-            soft_skill_ratio = ratios['soft_skill_ratio']
-            technical_ratio = ratios['technical_ratio']
-            num_soft = int(round(request.num_questions * soft_skill_ratio / 100))
-            num_tech = request.num_questions - num_soft
-            
-            async with AsyncSessionLocal() as session:
-                # Get soft skill questions with RANDOM ordering
-                query_soft = async_select(QuestionORM).where(QuestionORM.skill_type == "soft_skill")
-                if request.topic:
-                    query_soft = query_soft.where(QuestionORM.topic == request.topic)
-                if request.difficulty:
-                    query_soft = query_soft.where(QuestionORM.difficulty == request.difficulty.value)
-                if request.question_type:
-                    query_soft = query_soft.where(QuestionORM.type == request.question_type.value)
-                # FIXED: Use random ordering instead of created_at
-                query_soft = query_soft.order_by(func.random()).limit(num_soft)
-                result_soft = await session.execute(query_soft)
-                soft_questions = result_soft.scalars().all()
-
-                # Get technical questions with RANDOM ordering
-                query_tech = async_select(QuestionORM).where(QuestionORM.skill_type == "technical")
-                if request.topic:
-                    query_tech = query_tech.where(QuestionORM.topic == request.topic)
-                if request.difficulty:
-                    query_tech = query_tech.where(QuestionORM.difficulty == request.difficulty.value)
-                if request.question_type:
-                    query_tech = query_tech.where(QuestionORM.type == request.question_type.value)
-                # FIXED: Use random ordering instead of created_at
-                query_tech = query_tech.order_by(func.random()).limit(num_tech)
-                result_tech = await session.execute(query_tech)
-                tech_questions = result_tech.scalars().all()
-
-                questions = list(soft_questions) + list(tech_questions)
-                if not questions:
-                    raise HTTPException(status_code=404, detail="No questions found matching the criteria")
-                
-                quiz_questions = []
-                for q in questions:
-                    quiz_questions.append(QuestionForEvaluation(
-                        id=q.id,
-                        question_text=q.question_text,
-                        type=q.type,
-                        topic=q.topic,
-                        difficulty=q.difficulty,
-                        skill_type=q.skill_type,
-                        managerial_level=q.managerial_level,
-                        options=q.options if q.type == "mcq" else None
-                    ))
-                logger.info(f"Retrieved {len(quiz_questions)} randomized questions for quiz (with managerial ratios)")
-                return quiz_questions
-    
-    # Regular query without managerial ratios - ALSO RANDOMIZED
-    query = async_select(QuestionORM)
-    if request.topic:
-        query = query.where(QuestionORM.topic == request.topic)
-    if request.difficulty:
-        query = query.where(QuestionORM.difficulty == request.difficulty.value)
-    if request.skill_type:
-        query = query.where(QuestionORM.skill_type == request.skill_type.value)
-    if request.managerial_level:
-        query = query.where(QuestionORM.managerial_level == request.managerial_level)
-    if request.question_type:
-        query = query.where(QuestionORM.type == request.question_type.value)
-    
-    # FIXED: Use random ordering instead of created_at
-    query = query.order_by(func.random()).limit(request.num_questions)
-    
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(query)
-        questions = result.scalars().all()
-        
-        if not questions:
-            raise HTTPException(status_code=404, detail="No questions found matching the criteria")
-        
-        quiz_questions = []
-        for q in questions:
-            quiz_questions.append(QuestionForEvaluation(
-                id=q.id,
-                question_text=q.question_text,
-                type=q.type,
-                topic=q.topic,
-                difficulty=q.difficulty,
-                skill_type=q.skill_type,
-                managerial_level=q.managerial_level,
-                options=q.options if q.type == "mcq" else None
-            ))
-        logger.info(f"Retrieved {len(quiz_questions)} randomized questions for quiz")
-        return quiz_questions
+    return await get_quiz_questions(request)
 
 @app.post("/quiz/evaluate/", response_model=QuizEvaluationResponse)
 async def evaluate_quiz(request: QuizEvaluationRequest):
     logger.info(f"Evaluating quiz with {len(request.answers)} answers")
     if not request.answers:
         raise HTTPException(status_code=400, detail="No answers provided")
+    metrics.quiz_size.observe(len(request.answers))
 
-    quiz_attempt_id = request.quiz_attempt_id
-    if not quiz_attempt_id:
-        user_id = request.answers[0].user_id if request.answers and request.answers[0].user_id else None
-        if user_id:
-            quiz_attempt = await create_quiz_attempt(
-                QuizAttemptCreateRequest(
-                    user_id=user_id,
-                    num_questions=len(request.answers)
-                )
-            )
-            quiz_attempt_id = quiz_attempt.id
+    started_at = datetime.utcnow()
+    user_id = request.answers[0].user_id if request.answers and request.answers[0].user_id else None
+
+    async with AsyncSessionLocal() as session:
+        question_ids = list({user_answer.question_id for user_answer in request.answers})
+        result = await session.execute(async_select(QuestionORM).where(QuestionORM.id.in_(question_ids)))
+        questions_by_id = {q.id: q for q in result.scalars().all()}
 
+    to_grade = []
+    for user_answer in request.answers:
+        question = questions_by_id.get(user_answer.question_id)
+        if not question:
+            logger.warning(f"Question {user_answer.question_id} not found")
+            continue
+        to_grade.append((question, user_answer))
+    
+    # MCQs are graded inline, subjective answers are fanned out to the LLM concurrently
+    outcomes = await grade_answers([(question, ua.user_answer) for question, ua in to_grade])
+    
     evaluations = []
+    rows = []
     total_score = 0.0
+    for (question, user_answer), outcome in zip(to_grade, outcomes):
+        try:
+            if isinstance(outcome, Exception):
+                raise outcome
+            score, feedback, method = outcome
+            
+            rows.append({
+                "question_id": question.id,
+                "user_answer": user_answer.user_answer,
+                "score": score,
+                "feedback": feedback,
+                "evaluation_method": method,
+                "user_id": user_answer.user_id,
+            })
+            evaluations.append(EvaluationResult(
+                question_id=question.id,
+                question_text=question.question_text,
+                user_answer=user_answer.user_answer,
+                correct_answer=question.answer,
+                score=score,
+                feedback=feedback,
+                is_correct=score >= 0.7,
+                evaluation_method=method
+            ))
+            total_score += score
+            logger.info(f"Evaluated question {question.id}: score={score:.2f}")
+        except Exception as e:
+            logger.error(f"Error evaluating question {user_answer.question_id}: {e}")
+            continue
     
-    async with AsyncSessionLocal() as session:
-        for user_answer in request.answers:
-            try:
-                query = async_select(QuestionORM).where(QuestionORM.id == user_answer.question_id)
-                result = await session.execute(query)
-                question = result.scalars().first()
-                
-                if not question:
-                    logger.warning(f"Question {user_answer.question_id} not found")
-                    continue
-                
-                if question.type == "mcq":
-                    score, feedback, method = await evaluate_mcq_answer(question, user_answer.user_answer)
-                else:
-                    score, feedback, method = await evaluate_subjective_answer(question, user_answer.user_answer)
-                
-                await save_evaluation_to_db(
-                    question.id,
-                    user_answer.user_answer,
-                    score,
-                    feedback,
-                    method,
-                    user_answer.user_id,
-                    quiz_attempt_id=quiz_attempt_id
-                )
-                
-                evaluation_result = EvaluationResult(
-                    question_id=question.id,
-                    question_text=question.question_text,
-                    user_answer=user_answer.user_answer,
-                    correct_answer=question.answer,
-                    score=score,
-                    feedback=feedback,
-                    is_correct=score >= 0.7,
-                    evaluation_method=method
-                )
-                evaluations.append(evaluation_result)
-                total_score += score
-                logger.info(f"Evaluated question {question.id}: score={score:.2f}")
-            except Exception as e:
-                logger.error(f"Error evaluating question {user_answer.question_id}: {e}")
-                continue
-        
-        # Update quiz_attempt with score and end time
-        if quiz_attempt_id:
-            attempt_obj = await session.get(QuizAttemptORM, quiz_attempt_id)
-            if attempt_obj:
-                attempt_obj.ended_at = datetime.utcnow()
-                attempt_obj.score = total_score
-                await session.commit()
+    # Evaluation rows and the quiz attempt score are written in one transaction
+    quiz_attempt_id = await save_evaluations_to_db(
+        rows,
+        quiz_attempt_id=request.quiz_attempt_id,
+        total_score=total_score,
+        user_id=user_id,
+        num_questions=len(request.answers),
+        started_at=started_at
+    )
     
     if not evaluations:
         raise HTTPException(status_code=400, detail="No valid evaluations could be performed")
@@ -344,85 +302,39 @@ async def create_quiz_attempt(req: QuizAttemptCreateRequest):
 
 @app.get("/quiz/attempts/{user_id}", response_model=List[QuizAttemptOut])
 async def get_quiz_attempts_for_user(user_id: str):
-    async with AsyncSessionLocal() as session:
+    async with ReadSessionLocal() as session:
         result = await session.execute(
             async_select(QuizAttemptORM).where(QuizAttemptORM.user_id == user_id).order_by(QuizAttemptORM.started_at.desc())
         )
         attempts = result.scalars().all()
         return attempts
 
-# Fixed: This is the key endpoint that matches your old working code
+# Upper bound on attempt ids accepted by the batched evaluations endpoint
+MAX_ATTEMPTS_PER_REQUEST = 200
+
+@app.get("/quiz/attempt/evaluations", response_model=Dict[int, List[EvaluationResult]])
+async def get_evaluations_for_attempts(attempt_ids: List[int] = Query(...)):
+    if len(attempt_ids) > MAX_ATTEMPTS_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_ATTEMPTS_PER_REQUEST} attempt ids can be requested at once"
+        )
+    return await get_attempt_evaluation_results(list(dict.fromkeys(attempt_ids)))
+
 @app.get("/quiz/attempt/{attempt_id}/evaluations", response_model=List[EvaluationResult])
 async def get_attempt_evaluations(attempt_id: int):
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            async_select(EvaluationORM).where(EvaluationORM.quiz_attempt_id == attempt_id)
-        )
-        evals = result.scalars().all()
-        
-        out = []
-        for e in evals:
-            # Fetch question text (matches your old code structure)
-            question_text = ""
-            correct_answer = ""
-            if e.question_id:
-                qresult = await session.execute(async_select(QuestionORM).where(QuestionORM.id == e.question_id))
-                q = qresult.scalars().first()
-                if q:
-                    question_text = q.question_text
-                    correct_answer = q.answer
-            
-            out.append(EvaluationResult(
-                question_id=e.question_id,
-                question_text=question_text,
-                user_answer=e.user_answer,
-                correct_answer=correct_answer,
-                score=e.score,
-                feedback=e.feedback,
-                is_correct=e.score >= 0.7,
-                evaluation_method=e.evaluation_method
-            ))
-        return out
+    results = await get_attempt_evaluation_results([attempt_id])
+    return results[attempt_id]
 
 # Statistics Endpoints (matching your old working code structure)
 @app.get("/stats/user/{user_id}")
 async def get_user_stats(user_id: str):
-    async with AsyncSessionLocal() as session:
-        query = async_select(EvaluationORM).where(EvaluationORM.user_id == user_id)
-        result = await session.execute(query)
-        evaluations = result.scalars().all()
-        
-        if not evaluations:
-            raise HTTPException(status_code=404, detail="No evaluations found for this user")
-        
-        total_questions = len(evaluations)
-        total_score = sum(eval_item.score for eval_item in evaluations)
-        average_score = total_score / total_questions
-        
-        mcq_evals = [e for e in evaluations if e.evaluation_method == "exact_match"]
-        subjective_evals = [e for e in evaluations if e.evaluation_method in ["llm_evaluated", "keyword_match"]]
-        
-        mcq_correct = sum(1 for e in mcq_evals if e.score == 1.0)
-        subjective_avg = sum(e.score for e in subjective_evals) / len(subjective_evals) if subjective_evals else 0
-        
-        recent_evals = sorted(evaluations, key=lambda x: x.created_at, reverse=True)[:10]
-        recent_avg = sum(e.score for e in recent_evals) / len(recent_evals) if recent_evals else 0
-        
-        return {
-            "user_id": user_id,
-            "total_questions_attempted": total_questions,
-            "overall_average_score": round(average_score, 3),
-            "overall_percentage": round(average_score * 100, 1),
-            "mcq_questions": len(mcq_evals),
-            "mcq_correct": mcq_correct,
-            "mcq_accuracy": round((mcq_correct / len(mcq_evals)) * 100, 1) if mcq_evals else 0,
-            "subjective_questions": len(subjective_evals),
-            "subjective_average_score": round(subjective_avg, 3),
-            "subjective_percentage": round(subjective_avg * 100, 1),
-            "recent_performance": round(recent_avg * 100, 1),
-            "first_attempt": min(e.created_at for e in evaluations),
-            "last_attempt": max(e.created_at for e in evaluations)
-        }
+    async with ReadSessionLocal() as session:
+        stats = await session.get(UserStatsORM, user_id)
+    
+    if not stats or not stats.total_questions:
+        raise HTTPException(status_code=404, detail="No evaluations found for this user")
+    return user_stats_response(stats)
 
 # Managerial Ratios Endpoint
 @app.get("/managerial_ratio/{managerial_level}")
@@ -432,6 +344,10 @@ async def get_managerial_ratio(managerial_level: str):
         return ratios
     raise HTTPException(status_code=404, detail="No ratio found for this managerial level")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Health Check
 @app.get("/health")
 async def health_check():
@@ -442,7 +358,12 @@ async def health_check():
         "features": [
             "question_generation", "quiz_evaluation", "user_statistics",
             "managerial_ratios", "quiz_attempt_tracking"
-        ]
+        ],
+        "evaluation_cache": evaluation_cache.stats(),
+        "question_bank_cache": question_bank_cache.stats(),
+        "reference_data": reference_data.stats(),
+        "llm": llm_gateway.stats(),
+        "db_pool": {role: e.sync_engine.pool.status() for role, e in engines.items()}
     }
 
 if __name__ == "__main__":
@@ -1,10 +1,13 @@
-from sqlalchemy import Column, Integer, String, Text, ARRAY, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ARRAY, JSON, DateTime, Float, ForeignKey, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
 
 class QuestionORM(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        Index("ix_questions_bucket_sample_key", "topic", "skill_type", "difficulty", "type", "sample_key"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     question_text = Column(Text, nullable=False, unique=True)
     answer = Column(Text, nullable=True)
@@ -16,6 +19,8 @@ class QuestionORM(Base):
     options = Column(ARRAY(Text), nullable=True)
     correct_option = Column(Text, nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # Uniform random key used to sample quiz questions through an index
+    sample_key = Column(Float, nullable=False, server_default=text("random()"), index=True)
     evaluations = relationship("EvaluationORM", back_populates="question")
 
 class QuizAttemptORM(Base):
@@ -51,3 +56,54 @@ class ManagerialRatioORM(Base):
     managerial_level = Column(String(32), primary_key=True)
     soft_skill_ratio = Column(Integer, nullable=False)
     technical_ratio = Column(Integer, nullable=False)
+
+class ReferenceDataVersionORM(Base):
+    # Bumped by the reference_data_changed() trigger on every write to a
+    # reference table, so workers can poll for changes
+    __tablename__ = "reference_data_versions"
+    name = Column(String(64), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class EvaluationCacheORM(Base):
+    __tablename__ = "evaluation_cache"
+    __table_args__ = (UniqueConstraint("question_id", "answer_hash", name="uq_evaluation_cache_key"),)
+    id = Column(Integer, primary_key=True, index=True)
+    question_id = Column(Integer, ForeignKey("questions.id", ondelete="CASCADE"), nullable=False)
+    answer_hash = Column(String(64), nullable=False)
+    model_answer_hash = Column(String(64), nullable=False)
+    score = Column(Float, nullable=False)
+    feedback = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class UserStatsORM(Base):
+    __tablename__ = "user_stats"
+    user_id = Column(String(100), primary_key=True)
+    total_questions = Column(Integer, nullable=False, default=0)
+    total_score = Column(Float, nullable=False, default=0.0)
+    mcq_questions = Column(Integer, nullable=False, default=0)
+    mcq_correct = Column(Integer, nullable=False, default=0)
+    subjective_questions = Column(Integer, nullable=False, default=0)
+    subjective_score = Column(Float, nullable=False, default=0.0)
+    # Scores of the most recent evaluations, newest first
+    recent_scores = Column(ARRAY(Float), nullable=False)
+    first_attempt = Column(DateTime, nullable=True)
+    last_attempt = Column(DateTime, nullable=True)
+
+class GenerationJobORM(Base):
+    __tablename__ = "generation_jobs"
+    id = Column(String(36), primary_key=True)
+    # queued, running, succeeded or failed
+    status = Column(String(20), nullable=False, index=True)
+    # "api" for admin submissions, "replenisher" for background top-ups
+    source = Column(String(20), nullable=False, default="api")
+    request = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    question_ids = Column(ARRAY(Integer), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Earliest time a requeued job may be claimed again, for retry backoff
+    not_before = Column(DateTime, nullable=True)
@@ -61,6 +61,22 @@ class QuestionOut(BaseModel):
     class Config:
         from_attributes = True
 
+class GenerationJobOut(BaseModel):
+    id: str
+    status: str
+    source: str
+    request: Dict[str, Any]
+    attempts: int
+    question_ids: Optional[List[int]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    questions: Optional[List[QuestionOut]] = None
+
+    class Config:
+        from_attributes = True
+
 class QuestionForEvaluation(BaseModel):
     id: int
     question_text: str
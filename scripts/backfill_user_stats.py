@@ -0,0 +1,31 @@
+"""Builds the user_stats rollup from existing evaluations.
+
+Run once after deploying the rollup, or any time it needs repairing:
+
+    python scripts/backfill_user_stats.py
+    python scripts/backfill_user_stats.py --user-id emp-123
+"""
+import os
+import sys
+import asyncio
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine, Base  # noqa: E402
+from services.stats_service import rebuild_user_stats  # noqa: E402
+
+async def main(user_id: str = None):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    users = await rebuild_user_stats(user_id)
+    print(f"Statistics rollup written for {users} user(s)")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user-id", help="only rebuild this user")
+    args = parser.parse_args()
+    asyncio.run(main(args.user_id))
@@ -0,0 +1,142 @@
+"""Checks the JSON cleaners against a corpus of malformed LLM outputs and times
+the single-pass scanner against the previous regex/concatenation cleaner.
+
+    python scripts/benchmark_json_cleaner.py
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.helpers import clean_json_response, clean_evaluation_json_response  # noqa: E402
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_output_corpus.json")
+
+# Previous implementation, kept verbatim for comparison
+def legacy_fix_common_json_issues(json_str: str) -> str:
+    json_str = re.sub(r',\s*}', '}', json_str)
+    json_str = re.sub(r',\s*]', ']', json_str)
+    json_str = re.sub(r'}\s*{', '},{', json_str)
+    json_str = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', json_str)
+    return json_str
+
+def legacy_clean_json_response(content: str) -> str:
+    try:
+        # Fixed: properly closed string literals
+        content = re.sub(r'```,', '', content)
+        content = re.sub(r'```', '', content)
+        content = re.sub(r'^[^[{]*', '', content)
+        content = re.sub(r'[^}\]]*$', '', content)
+        
+        start_idx = content.find('[')
+        end_idx = content.rfind(']')
+        
+        if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
+            json_content = content[start_idx:end_idx + 1]
+        else:
+            start_idx = content.find('{')
+            end_idx = content.rfind('}')
+            if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
+                json_content = content[start_idx:end_idx + 1]
+                if json_content.count('{') > 1:
+                    objects = []
+                    current_obj = ""
+                    brace_count = 0
+                    for char in json_content:
+                        current_obj += char
+                        if char == '{':
+                            brace_count += 1
+                        elif char == '}':
+                            brace_count -= 1
+                            if brace_count == 0:
+                                try:
+                                    json.loads(current_obj.strip())
+                                    objects.append(current_obj.strip())
+                                    current_obj = ""
+                                except:
+                                    current_obj = ""
+                    if objects:
+                        json_content = '[' + ','.join(objects) + ']'
+                else:
+                    json_content = '[' + json_content + ']'
+            else:
+                raise ValueError("No valid JSON structure found in response")
+        
+        json_content = legacy_fix_common_json_issues(json_content)
+        
+        try:
+            json.loads(json_content)
+            return json_content.strip()
+        except json.JSONDecodeError as e:
+            pass
+            pass
+            raise ValueError(f"Invalid JSON after cleaning: {str(e)}")
+    except Exception as e:
+        pass
+        pass
+        raise ValueError(f"Failed to clean JSON response: {str(e)}")
+
+def count_items(cleaner, content: str, kind: str):
+    try:
+        parsed = json.loads(cleaner(content))
+    except ValueError:
+        return None
+    if kind == "evaluation":
+        return 1 if isinstance(parsed, dict) else None
+    return len(parsed) if isinstance(parsed, list) else None
+
+def check_corpus():
+    with open(CORPUS_PATH) as f:
+        corpus = json.load(f)
+    cleaners = {"array": clean_json_response, "evaluation": clean_evaluation_json_response}
+    print(f"{'case':<38} {'expected':>8} {'legacy':>7} {'scanner':>8}")
+    failures = 0
+    for case in corpus:
+        # The legacy evaluation cleaner only sliced between braces, so it is
+        # compared on array cases only
+        legacy_items = count_items(legacy_clean_json_response, case["content"], "array") if case["kind"] == "array" else "-"
+        items = count_items(cleaners[case["kind"]], case["content"], case["kind"])
+        failures += items != case["expected_items"]
+        print(f"{case['name']:<38} {case['expected_items']:>8} {str(legacy_items):>7} {str(items):>8}")
+    return failures
+
+def synthetic_response(items: int) -> str:
+    # Objects without an enclosing array and with one broken item: the legacy
+    # cleaner's concatenation fallback path
+    body = "\n".join(
+        json.dumps({
+            "type": "subjective",
+            "question": f"Question number {i}: describe a situation where you had to adapt quickly?",
+            "answer": "A detailed model answer that spans a few sentences. " * 4,
+        })
+        for i in range(items)
+    )
+    return "Here are the questions:\n" + body + '\n{"question": broken}\n'
+
+def best_of(fn, content: str, runs: int = 5) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(content)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+def benchmark():
+    print(f"\n{'items':>6} {'chars':>9} {'legacy ms':>10} {'scanner ms':>11}")
+    for items in (10, 100, 1000, 3000):
+        content = synthetic_response(items)
+        print(
+            f"{items:>6} {len(content):>9} "
+            f"{best_of(legacy_clean_json_response, content):>10.2f} "
+            f"{best_of(clean_json_response, content):>11.2f}"
+        )
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    failed = check_corpus()
+    benchmark()
+    sys.exit(1 if failed else 0)
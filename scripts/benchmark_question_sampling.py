@@ -0,0 +1,129 @@
+"""Compares ORDER BY random() with sample_key probing as the question bank grows.
+
+Times the statements services.question_service.sample_questions itself runs,
+for each filter shape quiz start produces: fully filtered buckets (served by
+the composite index), partial filters (no difficulty or type, the managerial
+split by skill type) and a selective filter outside the composite index.
+
+Oversampling and pivots come from QUESTION_SAMPLE_OVERSAMPLE and
+QUESTION_SAMPLE_PIVOTS, as in the service. Runs against DATABASE_URL using a
+temporary table named questions, which shadows the real one on the benchmark
+connection, so the real questions table is left untouched:
+
+    python scripts/benchmark_question_sampling.py --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from collections import Counter
+
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select as async_select
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine  # noqa: E402
+from models import QuestionORM  # noqa: E402
+from services.question_service import question_filters, sample_questions  # noqa: E402
+
+SETUP = [
+    "DROP TABLE IF EXISTS pg_temp.questions",
+    # Same columns and indexes as QuestionORM
+    """CREATE TEMP TABLE questions (
+        id SERIAL PRIMARY KEY,
+        question_text TEXT NOT NULL,
+        answer TEXT,
+        type VARCHAR(20) NOT NULL,
+        topic VARCHAR(100),
+        difficulty VARCHAR(20),
+        skill_type VARCHAR(20),
+        managerial_level VARCHAR(50),
+        options TEXT[],
+        correct_option TEXT,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        sample_key DOUBLE PRECISION NOT NULL DEFAULT random()
+    )""",
+    # Independent attributes: 20 topics, 4 difficulties, 2 skill types, a third
+    # subjective, 1 in 100 rows tagged with a managerial level. A fully
+    # filtered bucket holds about 1/240 of the rows.
+    """INSERT INTO pg_temp.questions (question_text, answer, type, topic, difficulty, skill_type, managerial_level)
+       SELECT 'Question ' || g, 'B',
+              CASE WHEN random() < 1.0 / 3 THEN 'subjective' ELSE 'mcq' END,
+              'topic_' || floor(random() * 20)::int,
+              (ARRAY['novice', 'beginner', 'intermediate', 'advanced'])[1 + floor(random() * 4)::int],
+              CASE WHEN random() < 0.5 THEN 'technical' ELSE 'soft_skill' END,
+              CASE WHEN random() < 0.01 THEN 'director' END
+       FROM generate_series(1, :size) AS g""",
+    "CREATE INDEX ON pg_temp.questions (sample_key)",
+    "CREATE INDEX ON pg_temp.questions (topic, skill_type, difficulty, type, sample_key)",
+    "ANALYZE pg_temp.questions",
+]
+
+# question_filters() arguments per shape: topic, difficulty, skill_type, managerial_level, question_type
+SHAPES = {
+    "full": ("topic_3", "advanced", "soft_skill", None, "mcq"),
+    "topic+skill": ("topic_3", None, "soft_skill", None, None),
+    "topic+difficulty": ("topic_3", "advanced", None, None, None),
+    "topic": ("topic_3", None, None, None, None),
+    "managerial_level": ("topic_3", None, None, "director", None),
+}
+
+async def setup(conn, size: int):
+    for statement in SETUP:
+        await conn.execute(text(statement), {"size": size} if ":size" in statement else {})
+
+async def order_by_random(session, filters: list, k: int) -> list:
+    result = await session.execute(
+        async_select(QuestionORM).where(*filters).order_by(func.random()).limit(k)
+    )
+    return list(result.scalars().all())
+
+async def time_strategy(session, strategy, filters: list, k: int, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await strategy(session, filters, k)
+        # Sampled rows must not be served from the identity map on the next run
+        session.expunge_all()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+async def uniformity(session, k: int, draws: int) -> float:
+    # Ratio between the most and least frequently drawn ids; 1.0 is perfectly uniform
+    counts = Counter()
+    filters = question_filters(*SHAPES["full"])
+    for _ in range(draws):
+        counts.update(q.id for q in await sample_questions(session, filters, k))
+        session.expunge_all()
+    return max(counts.values()) / max(1, min(counts.values()))
+
+async def main(sizes: list, k: int, runs: int):
+    print(f"{'rows':>10} {'filter':>17} {'strategy':>16} {'p50 ms':>9} {'p95 ms':>9}")
+    async with engine.connect() as conn:
+        session = AsyncSession(bind=conn)
+        for size in sizes:
+            await setup(conn, size)
+            for shape, args in SHAPES.items():
+                filters = question_filters(*args)
+                for name, strategy in (("order_by_random", order_by_random), ("sample_key", sample_questions)):
+                    timings = sorted(await time_strategy(session, strategy, filters, k, runs))
+                    p50 = statistics.median(timings)
+                    p95 = timings[int(len(timings) * 0.95) - 1]
+                    print(f"{size:>10} {shape:>17} {name:>16} {p50:>9.2f} {p95:>9.2f}")
+
+        await setup(conn, 48_000)
+        print(f"\nmax/min draw frequency over a ~200-row bucket: {await uniformity(session, k, 2000):.2f}")
+        await session.close()
+    await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--k", type=int, default=10, help="questions per quiz")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.k, args.runs))
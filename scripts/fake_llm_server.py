@@ -0,0 +1,178 @@
+"""Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+Answers generation and grading prompts with templated JSON, after a sampled
+delay, and injects 429s, 500s and truncated output at the configured rates.
+Point the app at it instead of Groq:
+
+    python scripts/fake_llm_server.py --port 9000 --latency lognormal:0.8,0.5 --rate-limit-rate 0.02
+    GROQ_API_URL=http://localhost:9000/v1/chat/completions uvicorn main:app
+
+Several instances on different ports can be listed in LLM_BACKENDS to
+exercise hedging and failover.
+"""
+import re
+import json
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+GENERATION = re.compile(r"Generate exactly (\d+) unique (multiple choice|subjective) questions about '([^']*)'")
+BATCH_ITEM = re.compile(r"^\[Item (\d+)\]", re.MULTILINE)
+
+WORDS = (
+    "budget forecast stakeholder latency backlog roadmap escalation vendor contract audit "
+    "compliance onboarding retention pipeline deployment rollback incident postmortem capacity "
+    "throughput migration schema index replica cache eviction quorum consensus ledger invoice "
+    "negotiation feedback mentoring delegation conflict priority deadline milestone estimate "
+    "variance risk mitigation dependency interface contract protocol encryption token session "
+    "partition shard queue consumer producer batch stream window aggregate metric alert dashboard "
+    "threshold baseline regression benchmark profile heap thread lock deadlock timeout retry "
+    "backoff circuit gateway proxy certificate rotation secret policy governance charter scope "
+    "requirement acceptance criteria sprint velocity refactor coverage fixture mock contract "
+    "handover transition succession appraisal calibration promotion hiring interview culture"
+).split()
+
+FEEDBACK = [
+    "Covers the main idea but misses supporting detail.",
+    "Accurate and complete, with a clear example.",
+    "Partially correct; key trade-offs are not discussed.",
+    "Off topic for most of the answer.",
+]
+
+class FakeLLM:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        kind, _, params = args.latency.partition(":")
+        self.latency_kind = kind
+        self.latency_params = [float(p) for p in params.split(",")] if params else []
+
+    def latency(self) -> float:
+        p = self.latency_params
+        if self.latency_kind == "fixed":
+            return p[0]
+        if self.latency_kind == "uniform":
+            return self.rng.uniform(p[0], p[1])
+        if self.latency_kind == "lognormal":
+            # median, sigma
+            return self.rng.lognormvariate(0, p[1]) * p[0]
+        raise ValueError(f"Unknown latency distribution: {self.latency_kind}")
+
+    def phrase(self, n: int) -> str:
+        return " ".join(self.rng.choice(WORDS) for _ in range(n))
+
+    def questions(self, count: int, mcq: bool, topic: str) -> list:
+        items = []
+        for _ in range(count):
+            text = f"In {topic}, how would you handle {self.phrase(4)} given {self.phrase(4)}?"
+            if mcq:
+                options = [self.phrase(3).capitalize() for _ in range(4)]
+                items.append({"type": "mcq", "question": text, "options": options, "answer": self.rng.choice(options)})
+            else:
+                items.append({"type": "subjective", "question": text, "answer": f"Explain {self.phrase(10)}."})
+        return items
+
+    def grade(self) -> dict:
+        return {"score": round(self.rng.uniform(0.2, 1.0), 2), "feedback": self.rng.choice(FEEDBACK)}
+
+    def respond(self, prompt: str) -> str:
+        match = GENERATION.search(prompt)
+        if match:
+            count, kind, topic = int(match.group(1)), match.group(2), match.group(3)
+            return json.dumps(self.questions(count, kind == "multiple choice", topic), indent=2)
+        items = BATCH_ITEM.findall(prompt)
+        if items:
+            return json.dumps([{"id": int(i), **self.grade()} for i in items])
+        if "Evaluate the user's answer" in prompt:
+            return json.dumps(self.grade())
+        return "OK"
+
+    def fault(self):
+        roll = self.rng.random()
+        if roll < self.args.rate_limit_rate:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit"}},
+                status_code=429,
+                headers={"Retry-After": str(self.args.retry_after)},
+            )
+        if roll < self.args.rate_limit_rate + self.args.error_rate:
+            return JSONResponse({"error": {"message": "Internal error", "type": "server_error"}}, status_code=500)
+        return None
+
+    def content(self, payload: dict) -> str:
+        prompt = payload["messages"][-1]["content"]
+        content = self.respond(prompt)
+        if self.rng.random() < self.args.malformed_rate:
+            content = content[: self.rng.randrange(1, max(2, len(content)))]
+        max_tokens = payload.get("max_tokens")
+        if max_tokens and not self.args.ignore_max_tokens:
+            # Truncate like a real model that runs out of completion tokens
+            content = content[: max_tokens * 4]
+        return content
+
+def create_app(args) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    llm = FakeLLM(args)
+
+    @app.post("/v1/chat/completions")
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        delay = llm.latency()
+        fault = llm.fault()
+        if fault is not None:
+            await asyncio.sleep(delay / 4)
+            return fault
+
+        content = llm.content(payload)
+        prompt_tokens = len(payload["messages"][-1]["content"]) // 4
+        completion_tokens = len(content) // 4
+        if args.tokens_per_second:
+            delay += completion_tokens / args.tokens_per_second
+
+        if payload.get("stream"):
+            async def events():
+                pieces = [content[i:i + 24] for i in range(0, len(content), 24)] or [""]
+                for piece in pieces:
+                    await asyncio.sleep(delay / len(pieces))
+                    chunk = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(delay)
+        return {
+            "id": "fake-completion",
+            "object": "chat.completion",
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--seed", type=int, default=1729)
+    parser.add_argument(
+        "--latency", default="lognormal:0.8,0.5",
+        help="fixed:SECONDS, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA"
+    )
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="add completion_tokens / rate to each delay")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 500")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of completions cut off mid-JSON")
+    parser.add_argument("--ignore-max-tokens", action="store_true", help="do not truncate to the request's max_tokens")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,202 @@
+"""Drives a mix of quiz traffic at a running instance and reports latency percentiles.
+
+Start the app against the fake LLM server with the query-count header on, then:
+
+    python scripts/fake_llm_server.py --port 9000 &
+    GROQ_API_URL=http://localhost:9000/v1/chat/completions DB_QUERY_COUNT_HEADER=true uvicorn main:app &
+    python scripts/load_test.py --duration 60 --concurrency 20 --report-json run.json
+
+Reports p50/p95/p99 latency, throughput and SQL statements per request (from the
+X-DB-Queries header) for each endpoint. With --baseline, exits non-zero when an
+endpoint's p95 grows by more than --tolerance or its query count grows at all.
+"""
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_MIX = "start=50,evaluate=30,stats=15,generate=5"
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.client: Optional[httpx.AsyncClient] = None
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.queries: Dict[str, List[int]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        # Questions served by /quiz/start/, reused to build quiz submissions
+        self.pool: List[dict] = []
+        mix = dict(part.split("=") for part in args.mix.split(","))
+        self.scenarios = [getattr(self, f"scenario_{name}") for name in mix]
+        self.weights = [float(weight) for weight in mix.values()]
+
+    async def call(self, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - started)
+        if "x-db-queries" in resp.headers:
+            self.queries[name].append(int(resp.headers["x-db-queries"]))
+        if resp.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return resp
+
+    def user_id(self) -> str:
+        return f"loadtest-{self.rng.randrange(self.args.users)}"
+
+    def quiz_request(self) -> dict:
+        body = {"num_questions": self.args.num_questions}
+        if self.args.topic:
+            body["topic"] = self.args.topic
+        return body
+
+    async def scenario_start(self):
+        resp = await self.call("quiz_start", "POST", "/quiz/start/", json=self.quiz_request())
+        if resp is not None:
+            self.pool.extend(resp.json())
+            del self.pool[:-1000]
+
+    async def scenario_evaluate(self):
+        if len(self.pool) < self.args.num_questions:
+            return await self.scenario_start()
+        user_id = self.user_id()
+        questions = self.rng.sample(self.pool, self.args.num_questions)
+        attempt = await self.call(
+            "quiz_attempt", "POST", "/quiz/attempt/",
+            json={"user_id": user_id, "num_questions": len(questions)}
+        )
+        answers = [
+            {
+                "question_id": q["id"],
+                "user_answer": self.rng.choice(q["options"]) if q.get("options")
+                else "It depends on the trade-offs between cost, risk and delivery time.",
+                "user_id": user_id,
+            }
+            for q in questions
+        ]
+        await self.call(
+            "quiz_evaluate", "POST", "/quiz/evaluate/",
+            json={"answers": answers, "quiz_attempt_id": attempt.json()["id"] if attempt is not None else None}
+        )
+
+    async def scenario_stats(self):
+        await self.call("user_stats", "GET", f"/stats/user/{self.user_id()}")
+
+    async def scenario_generate(self):
+        await self.call("generate", "POST", "/generate_questions_batch/", json={
+            "topic": self.args.topic or "Project management",
+            "difficulty": self.rng.choice(["novice", "beginner", "intermediate", "advanced"]),
+            "skill_type": self.rng.choice(["technical", "soft_skill"]),
+            "num_questions": self.args.generate_size,
+            "question_type": "mcq",
+        })
+
+    async def worker(self, deadline: float):
+        while time.perf_counter() < deadline:
+            scenario = self.rng.choices(self.scenarios, self.weights)[0]
+            await scenario()
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=self.args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=self.args.base_url, timeout=120, limits=limits) as client:
+            self.client = client
+            # Make sure there is something to quiz on before measuring
+            await self.scenario_start()
+            if not self.pool:
+                await self.scenario_generate()
+            self.latencies.clear()
+            self.queries.clear()
+            self.errors.clear()
+
+            started = time.perf_counter()
+            deadline = started + self.args.duration
+            await asyncio.gather(*[self.worker(deadline) for _ in range(self.args.concurrency)])
+            elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            latencies = self.latencies[name]
+            queries = self.queries[name]
+            endpoints[name] = {
+                "requests": len(latencies),
+                "errors": self.errors[name],
+                "throughput": round(len(latencies) / elapsed, 2),
+                "p50": round(percentile(latencies, 50), 4),
+                "p95": round(percentile(latencies, 95), 4),
+                "p99": round(percentile(latencies, 99), 4),
+                "queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+                "queries_max": max(queries) if queries else None,
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        return {"duration": round(elapsed, 2), "throughput": round(total / elapsed, 2), "endpoints": endpoints}
+
+def print_report(report: dict):
+    print(f"{report['duration']}s, {report['throughput']} req/s overall\n")
+    print(f"{'endpoint':<16}{'reqs':>7}{'errs':>6}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'max q':>7}")
+    for name, e in report["endpoints"].items():
+        queries = "-" if e["queries_mean"] is None else e["queries_mean"]
+        max_queries = "-" if e["queries_max"] is None else e["queries_max"]
+        print(
+            f"{name:<16}{e['requests']:>7}{e['errors']:>6}{e['throughput']:>8}"
+            f"{e['p50'] * 1000:>9.1f}{e['p95'] * 1000:>9.1f}{e['p99'] * 1000:>9.1f}{queries:>9}{max_queries:>7}"
+        )
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, base in baseline["endpoints"].items():
+        current = report["endpoints"].get(name)
+        if not current or not current["requests"]:
+            continue
+        if base["p95"] and current["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95'] * 1000:.1f} ms -> {current['p95'] * 1000:.1f} ms")
+        if base.get("queries_max") is not None and current["queries_max"] is not None \
+                and current["queries_max"] > base["queries_max"]:
+            regressions.append(f"{name}: max queries {base['queries_max']} -> {current['queries_max']}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of measured load")
+    parser.add_argument("--concurrency", type=int, default=20, help="simulated clients")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights: start, evaluate, stats, generate")
+    parser.add_argument("--users", type=int, default=200, help="distinct user ids to spread attempts over")
+    parser.add_argument("--topic", help="restrict quizzes and generation to one topic")
+    parser.add_argument("--num-questions", type=int, default=10, help="questions per quiz")
+    parser.add_argument("--generate-size", type=int, default=5, help="questions per generation request")
+    parser.add_argument("--seed", type=int, default=1729)
+    parser.add_argument("--report-json", help="write the report here")
+    parser.add_argument("--baseline", help="earlier --report-json output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 growth")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadTest(args).run())
+    print_report(report)
+    if args.report_json:
+        with open(args.report_json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
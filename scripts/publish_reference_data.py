@@ -0,0 +1,32 @@
+"""Tells every running worker to reload reference tables.
+
+Run after editing them in a way the reference_data_changed() trigger does not
+see, e.g. a restore or a bulk load with triggers disabled:
+
+    python scripts/publish_reference_data.py
+    python scripts/publish_reference_data.py --table managerial_ratios
+"""
+import os
+import sys
+import asyncio
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine  # noqa: E402
+from services.reference_data import reference_data  # noqa: E402
+
+async def main(table: str = None):
+    names = [table] if table else reference_data.names
+    for name in names:
+        await reference_data.publish(name)
+        print(f"Published change to {name}")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--table", choices=reference_data.names, help="only this table")
+    args = parser.parse_args()
+    asyncio.run(main(args.table))
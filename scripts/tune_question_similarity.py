@@ -0,0 +1,48 @@
+"""Picks QUESTION_SIMILARITY_THRESHOLD from labelled question pairs that the
+tests do not use (question_similarity_pairs.json). Prints, for each candidate
+threshold, how many rewordings it catches and how many distinct questions it
+would wrongly drop, then the lowest threshold that drops none of them.
+
+    python scripts/tune_question_similarity.py [pairs.json]
+"""
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.similarity_index import fingerprint, similarity  # noqa: E402
+
+PAIRS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "question_similarity_pairs.json")
+
+CANDIDATES = [round(0.30 + 0.05 * i, 2) for i in range(13)]
+
+def score(pairs):
+    return [(similarity(fingerprint(a), fingerprint(b)), a, b) for a, b in pairs]
+
+def main():
+    with open(sys.argv[1] if len(sys.argv) > 1 else PAIRS_PATH) as f:
+        labelled = json.load(f)
+    near = score(labelled["near_duplicate"])
+    distinct = score(labelled["distinct"])
+
+    print(f"{'threshold':>9}  {'caught':>9}  {'wrongly dropped':>15}")
+    chosen = None
+    for threshold in CANDIDATES:
+        caught = sum(s >= threshold for s, _, _ in near)
+        dropped = sum(s >= threshold for s, _, _ in distinct)
+        print(f"{threshold:>9.2f}  {caught:>4}/{len(near):<4}  {dropped:>7}/{len(distinct):<7}")
+        if chosen is None and dropped == 0:
+            chosen = threshold
+
+    print(f"\nLowest threshold dropping no distinct question: {chosen}")
+    print("\nRewordings it misses:")
+    for s, a, b in sorted(near):
+        if s < chosen:
+            print(f"  {s:.2f}  {a!r} / {b!r}")
+    print("\nClosest distinct pairs:")
+    for s, a, b in sorted(distinct, reverse=True)[:5]:
+        print(f"  {s:.2f}  {a!r} / {b!r}")
+
+if __name__ == "__main__":
+    main()
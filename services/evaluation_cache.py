@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.future import select as async_select
+
+from database import AsyncSessionLocal
+from models import QuestionORM, EvaluationCacheORM
+
+logger = logging.getLogger(__name__)
+
+EVALUATION_CACHE_ENABLED = os.getenv("EVALUATION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# In-process LRU tier
+EVALUATION_CACHE_SIZE = int(os.getenv("EVALUATION_CACHE_SIZE", "5000"))
+# Entry lifetime in seconds, shared by both tiers
+EVALUATION_CACHE_TTL = int(os.getenv("EVALUATION_CACHE_TTL", str(7 * 24 * 3600)))
+# Row cap for the persistent tier, enforced by prune()
+EVALUATION_CACHE_MAX_ROWS = int(os.getenv("EVALUATION_CACHE_MAX_ROWS", "200000"))
+# Seconds between prune() runs while the app is up
+EVALUATION_CACHE_PRUNE_INTERVAL = int(os.getenv("EVALUATION_CACHE_PRUNE_INTERVAL", "3600"))
+
+CacheKey = Tuple[int, str]
+
+_TRAILING_PUNCTUATION = re.compile(r"[.!?,;:]+$")
+
+def normalize_answer(text: Optional[str]) -> str:
+    # Case, whitespace and a closing full stop do not change the grade. Other
+    # punctuation is kept: "a > b" and "a < b", or "-5" and "5", differ.
+    text = " ".join((text or "").lower().split())
+    return _TRAILING_PUNCTUATION.sub("", text).rstrip()
+
+def hash_text(text: Optional[str]) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def cache_key(question: QuestionORM, user_answer: str) -> CacheKey:
+    return question.id, hash_text(normalize_answer(user_answer))
+
+class EvaluationCache:
+    def __init__(self, max_size: int = EVALUATION_CACHE_SIZE, ttl: int = EVALUATION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (model_answer_hash, score, feedback, expires_at)
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float, str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._prune_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        try:
+            await self.prune()
+        except Exception as e:
+            logger.warning(f"Evaluation cache prune failed: {e}")
+        self._prune_task = asyncio.create_task(self._prune_loop())
+
+    async def stop(self):
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+            await asyncio.gather(self._prune_task, return_exceptions=True)
+            self._prune_task = None
+
+    async def _prune_loop(self):
+        while True:
+            await asyncio.sleep(EVALUATION_CACHE_PRUNE_INTERVAL)
+            try:
+                await self.prune()
+            except Exception as e:
+                logger.warning(f"Evaluation cache prune failed: {e}")
+
+    def _remember(self, key: CacheKey, model_hash: str, score: float, feedback: str, expires_at: float):
+        self._entries[key] = (model_hash, score, feedback, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _lookup_memory(self, key: CacheKey, model_hash: str) -> Optional[Tuple[float, str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        cached_model_hash, score, feedback, expires_at = entry
+        if cached_model_hash != model_hash or expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return score, feedback
+
+    async def get_many(self, items: List[Tuple[QuestionORM, str]]) -> List[Optional[Tuple[float, str]]]:
+        results: List[Optional[Tuple[float, str]]] = [None] * len(items)
+        missing: Dict[CacheKey, List[int]] = {}
+        model_hashes: Dict[int, str] = {}
+
+        for idx, (question, user_answer) in enumerate(items):
+            key = cache_key(question, user_answer)
+            model_hash = model_hashes.setdefault(question.id, hash_text(question.answer))
+            results[idx] = self._lookup_memory(key, model_hash)
+            if results[idx] is None:
+                missing.setdefault(key, []).append(idx)
+
+        if missing:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+            stale = []
+            async with AsyncSessionLocal() as session:
+                rows = await session.execute(
+                    async_select(EvaluationCacheORM).where(
+                        tuple_(EvaluationCacheORM.question_id, EvaluationCacheORM.answer_hash).in_(list(missing))
+                    )
+                )
+                for row in rows.scalars().all():
+                    key = (row.question_id, row.answer_hash)
+                    if row.model_answer_hash != model_hashes.get(row.question_id) or row.created_at < cutoff:
+                        stale.append(row.id)
+                        continue
+                    age = (datetime.utcnow() - row.created_at).total_seconds()
+                    self._remember(key, row.model_answer_hash, row.score, row.feedback, time.monotonic() + self.ttl - age)
+                    for idx in missing[key]:
+                        results[idx] = (row.score, row.feedback)
+                if stale:
+                    await session.execute(delete(EvaluationCacheORM).where(EvaluationCacheORM.id.in_(stale)))
+                    await session.commit()
+
+        found = sum(1 for r in results if r is not None)
+        self.hits += found
+        self.misses += len(items) - found
+        return results
+
+    async def put_many(self, entries: List[Tuple[QuestionORM, str, float, str]]):
+        rows = {}
+        expires_at = time.monotonic() + self.ttl
+        for question, user_answer, score, feedback in entries:
+            key = cache_key(question, user_answer)
+            model_hash = hash_text(question.answer)
+            self._remember(key, model_hash, score, feedback, expires_at)
+            rows[key] = {
+                "question_id": key[0],
+                "answer_hash": key[1],
+                "model_answer_hash": model_hash,
+                "score": score,
+                "feedback": feedback,
+                "created_at": datetime.utcnow(),
+            }
+        if not rows:
+            return
+
+        stmt = pg_insert(EvaluationCacheORM).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_evaluation_cache_key",
+            set_={
+                "model_answer_hash": stmt.excluded.model_answer_hash,
+                "score": stmt.excluded.score,
+                "feedback": stmt.excluded.feedback,
+                "created_at": stmt.excluded.created_at,
+            },
+        )
+        async with AsyncSessionLocal() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def prune(self, max_rows: int = EVALUATION_CACHE_MAX_ROWS):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        async with AsyncSessionLocal() as session:
+            expired = await session.execute(delete(EvaluationCacheORM).where(EvaluationCacheORM.created_at < cutoff))
+            overflow = async_select(EvaluationCacheORM.id).order_by(
+                EvaluationCacheORM.created_at.desc()
+            ).offset(max_rows)
+            evicted = await session.execute(delete(EvaluationCacheORM).where(EvaluationCacheORM.id.in_(overflow)))
+            await session.commit()
+        logger.info(f"Evaluation cache pruned: {expired.rowcount} expired, {evicted.rowcount} over size limit")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+evaluation_cache = EvaluationCache()
@@ -1,16 +1,34 @@
+import os
 import json
+import asyncio
 import logging
-from typing import Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 from datetime import datetime
+from sqlalchemy import insert
 from sqlalchemy.future import select as async_select
 
 from database import AsyncSessionLocal
-from models import QuestionORM, EvaluationORM
-from services.llm_service import call_groq_llm
-from utils.helpers import build_evaluation_prompt, clean_evaluation_json_response
+from models import QuestionORM, EvaluationORM, QuizAttemptORM
+from schemas import EvaluationResult
+from services import metrics, tracing
+from services.llm_service import call_groq_llm, PRIORITY_GRADING
+from services.evaluation_cache import evaluation_cache, EVALUATION_CACHE_ENABLED
+from services.stats_service import apply_evaluations_to_user_stats
+from utils.helpers import (
+    build_evaluation_prompt, build_batch_evaluation_prompt,
+    clean_evaluation_json_response, clean_json_response
+)
+from utils.tokens import completion_budget
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of subjective answers graded by the LLM at the same time
+EVALUATION_CONCURRENCY = int(os.getenv("EVALUATION_CONCURRENCY", "5"))
+# Subjective answers packed into one grading prompt; 1 grades every answer separately
+EVALUATION_BATCH_SIZE = int(os.getenv("EVALUATION_BATCH_SIZE", "1"))
+
+GradeOutcome = Union[Tuple[float, str, str], Exception]
+
 async def evaluate_mcq_answer(question: QuestionORM, user_answer: str) -> Tuple[float, str, str]:
     is_correct = user_answer.strip().lower() == question.correct_option.strip().lower()
     score = 1.0 if is_correct else 0.0
@@ -24,9 +42,11 @@ async def evaluate_subjective_answer(question: QuestionORM, user_answer: str) ->
             question.answer,
             user_answer
         )
-        llm_response = await call_groq_llm(prompt)
-        cleaned_response = clean_evaluation_json_response(llm_response)
-        evaluation_data = json.loads(cleaned_response)
+        llm_response = await call_groq_llm(
+            prompt, priority=PRIORITY_GRADING, max_tokens=completion_budget("grading")
+        )
+        with tracing.span("json.clean", **{"json.input_chars": len(llm_response)}):
+            evaluation_data = json.loads(clean_evaluation_json_response(llm_response))
         
         score = float(evaluation_data.get("score", 0.0))
         feedback = evaluation_data.get("feedback", "No feedback provided")
@@ -49,27 +69,198 @@ async def evaluate_subjective_answer(question: QuestionORM, user_answer: str) ->
         feedback = f"Automated evaluation (LLM unavailable). Score based on keyword overlap with model answer."
         return score, feedback, "keyword_match"
 
-async def save_evaluation_to_db(
-    question_id: int, 
-    user_answer: str, 
-    score: float, 
-    feedback: str, 
-    evaluation_method: str,
+async def evaluate_subjective_batch(
+    items: List[Tuple[QuestionORM, str]]
+) -> List[Optional[Tuple[float, str, str]]]:
+    # Grades several answers with a single LLM call. Items the LLM skipped or
+    # returned malformed come back as None so the caller can grade them singly.
+    results: List[Optional[Tuple[float, str, str]]] = [None] * len(items)
+    try:
+        prompt = build_batch_evaluation_prompt(
+            [(question.question_text, question.answer, user_answer) for question, user_answer in items]
+        )
+        llm_response = await call_groq_llm(
+            prompt, priority=PRIORITY_GRADING, max_tokens=completion_budget("grading", len(items))
+        )
+        with tracing.span("json.clean", **{"json.input_chars": len(llm_response)}):
+            evaluation_data = json.loads(clean_json_response(llm_response))
+        
+        for entry in evaluation_data:
+            try:
+                idx = int(entry["id"]) - 1
+                if not 0 <= idx < len(items) or results[idx] is not None:
+                    continue
+                score = max(0.0, min(1.0, float(entry["score"])))
+                feedback = entry.get("feedback") or "No feedback provided"
+                results[idx] = (score, str(feedback), "llm_evaluated")
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+    except Exception as e:
+        logger.warning(f"Batch evaluation of {len(items)} answers failed: {e}")
+    
+    missing = sum(1 for r in results if r is None)
+    if missing:
+        logger.info(f"Batch evaluation returned {len(items) - missing}/{len(items)} items, grading the rest individually")
+    return results
+
+async def grade_answers(
+    items: List[Tuple[QuestionORM, str]],
+    concurrency: int = EVALUATION_CONCURRENCY,
+    batch_size: int = EVALUATION_BATCH_SIZE
+) -> List[GradeOutcome]:
+    # Returns one outcome per item, in input order. A failed item yields its
+    # exception instead of a (score, feedback, method) tuple so callers can
+    # skip it without losing the rest of the quiz.
+    outcomes: List[Optional[GradeOutcome]] = [None] * len(items)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def grade_subjective(idx: int, question: QuestionORM, user_answer: str):
+        async with semaphore:
+            try:
+                outcomes[idx] = await evaluate_subjective_answer(question, user_answer)
+            except Exception as e:
+                outcomes[idx] = e
+
+    async def grade_subjective_batch(batch: List[int]):
+        async with semaphore:
+            try:
+                results = await evaluate_subjective_batch([items[idx] for idx in batch])
+            except Exception as e:
+                logger.warning(f"Batch evaluation failed: {e}")
+                results = [None] * len(batch)
+        retry = []
+        for idx, result in zip(batch, results):
+            if result is None:
+                retry.append(grade_subjective(idx, *items[idx]))
+            else:
+                outcomes[idx] = result
+        if retry:
+            await asyncio.gather(*retry)
+
+    subjective = []
+    for idx, (question, user_answer) in enumerate(items):
+        if question.type == "mcq":
+            try:
+                outcomes[idx] = await evaluate_mcq_answer(question, user_answer)
+            except Exception as e:
+                outcomes[idx] = e
+        else:
+            subjective.append(idx)
+
+    if subjective and EVALUATION_CACHE_ENABLED:
+        try:
+            cached = await evaluation_cache.get_many([items[idx] for idx in subjective])
+        except Exception as e:
+            logger.warning(f"Evaluation cache lookup failed: {e}")
+            cached = [None] * len(subjective)
+        misses = []
+        for idx, hit in zip(subjective, cached):
+            if hit is None:
+                misses.append(idx)
+            else:
+                outcomes[idx] = (hit[0], hit[1], "cache_hit")
+        subjective = misses
+
+    if batch_size > 1 and len(subjective) > 1:
+        pending = [
+            grade_subjective_batch(subjective[i:i + batch_size])
+            for i in range(0, len(subjective), batch_size)
+        ]
+    else:
+        pending = [grade_subjective(idx, *items[idx]) for idx in subjective]
+
+    if pending:
+        await asyncio.gather(*pending)
+
+    if subjective and EVALUATION_CACHE_ENABLED:
+        # Keyword-match fallbacks are not cached so the next submission gets a real grade
+        graded = [
+            (items[idx][0], items[idx][1], outcomes[idx][0], outcomes[idx][1])
+            for idx in subjective
+            if isinstance(outcomes[idx], tuple) and outcomes[idx][2] == "llm_evaluated"
+        ]
+        try:
+            await evaluation_cache.put_many(graded)
+        except Exception as e:
+            logger.warning(f"Evaluation cache write failed: {e}")
+    
+    for outcome in outcomes:
+        metrics.evaluations.inc(method=outcome[2] if isinstance(outcome, tuple) else "error")
+    return outcomes
+
+async def save_evaluations_to_db(
+    rows: List[dict],
+    quiz_attempt_id: Optional[int] = None,
+    total_score: float = 0.0,
     user_id: Optional[str] = None,
-    quiz_attempt_id: Optional[int] = None
-):
+    num_questions: Optional[int] = None,
+    started_at: Optional[datetime] = None
+) -> Optional[int]:
+    # Writes every evaluation row, closes the quiz attempt and updates the
+    # per-user statistics rollup in a single transaction. Creates the attempt when none was given but a user is known.
+    # Returns the attempt id the rows were attached to.
+    now = datetime.utcnow()
     async with AsyncSessionLocal() as session:
-        evaluation = EvaluationORM(
-            question_id=question_id,
-            user_answer=user_answer,
-            score=score,
-            feedback=feedback,
-            evaluation_method=evaluation_method,
-            user_id=user_id,
-            quiz_attempt_id=quiz_attempt_id,
-            created_at=datetime.utcnow()
-        )
-        session.add(evaluation)
-        await session.commit()
-        await session.refresh(evaluation)
-        return evaluation
+        async with session.begin():
+            attempt = None
+            if quiz_attempt_id:
+                attempt = await session.get(QuizAttemptORM, quiz_attempt_id)
+                if not attempt:
+                    logger.warning(f"Quiz attempt {quiz_attempt_id} not found, saving evaluations without it")
+                    quiz_attempt_id = None
+            elif user_id:
+                attempt = QuizAttemptORM(
+                    user_id=user_id,
+                    started_at=started_at or now,
+                    num_questions=num_questions
+                )
+                session.add(attempt)
+                await session.flush()
+                quiz_attempt_id = attempt.id
+            
+            if attempt:
+                attempt.ended_at = now
+                attempt.score = total_score
+            
+            if rows:
+                await session.execute(
+                    insert(EvaluationORM).values([
+                        dict(row, quiz_attempt_id=quiz_attempt_id, created_at=now) for row in rows
+                    ])
+                )
+                await apply_evaluations_to_user_stats(session, rows, now)
+    return quiz_attempt_id
+
+async def get_attempt_evaluation_results(attempt_ids: List[int]) -> Dict[int, List[EvaluationResult]]:
+    # One joined query for any number of attempts, selecting only the columns
+    # EvaluationResult needs
+    query = async_select(
+        EvaluationORM.quiz_attempt_id,
+        EvaluationORM.question_id,
+        EvaluationORM.user_answer,
+        EvaluationORM.score,
+        EvaluationORM.feedback,
+        EvaluationORM.evaluation_method,
+        QuestionORM.question_text,
+        QuestionORM.answer,
+    ).outerjoin(
+        QuestionORM, QuestionORM.id == EvaluationORM.question_id
+    ).where(
+        EvaluationORM.quiz_attempt_id.in_(attempt_ids)
+    ).order_by(EvaluationORM.quiz_attempt_id, EvaluationORM.id)
+    
+    results: Dict[int, List[EvaluationResult]] = {attempt_id: [] for attempt_id in attempt_ids}
+    async with AsyncSessionLocal() as session:
+        rows = await session.execute(query)
+        for row in rows.all():
+            results[row.quiz_attempt_id].append(EvaluationResult(
+                question_id=row.question_id,
+                question_text=row.question_text or "",
+                user_answer=row.user_answer,
+                correct_answer=row.answer or "",
+                score=row.score,
+                feedback=row.feedback,
+                is_correct=row.score >= 0.7,
+                evaluation_method=row.evaluation_method
+            ))
+    return results
@@ -0,0 +1,333 @@
+import os
+import uuid
+import asyncio
+import logging
+import itertools
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+
+from fastapi import HTTPException
+from sqlalchemy import func, or_, text, update
+from sqlalchemy.future import select as async_select
+
+from database import AsyncSessionLocal
+from models import GenerationJobORM, QuestionORM
+from schemas import (
+    DifficultyLevel, SkillType, QuestionBatchRequest, QuestionType,
+    GenerationJobOut, QuestionOut
+)
+from services.question_service import generate_questions
+
+logger = logging.getLogger(__name__)
+
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "2"))
+GENERATION_JOB_MAX_ATTEMPTS = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "3"))
+# Seconds before a failed job is retried, doubled after each further failure
+# and capped at GENERATION_JOB_RETRY_MAX_DELAY, so an LLM outage does not use
+# up every attempt within seconds
+GENERATION_JOB_RETRY_DELAY = int(os.getenv("GENERATION_JOB_RETRY_DELAY", "30"))
+GENERATION_JOB_RETRY_MAX_DELAY = int(os.getenv("GENERATION_JOB_RETRY_MAX_DELAY", "600"))
+# A running job not updated for this many seconds is treated as orphaned by a dead worker
+GENERATION_JOB_STALE_AFTER = int(os.getenv("GENERATION_JOB_STALE_AFTER", "600"))
+# How often a worker touches the jobs it is running, so long generations are not
+# mistaken for orphans; must stay well below GENERATION_JOB_STALE_AFTER
+GENERATION_JOB_HEARTBEAT_INTERVAL = int(os.getenv("GENERATION_JOB_HEARTBEAT_INTERVAL", "60"))
+# How often queued jobs written by other workers (or left by crashes) are picked up
+GENERATION_JOB_SWEEP_INTERVAL = int(os.getenv("GENERATION_JOB_SWEEP_INTERVAL", "60"))
+
+# Background stock replenishment per (topic, difficulty, skill_type, managerial_level)
+REPLENISH_ENABLED = os.getenv("REPLENISH_ENABLED", "false").lower() in ("1", "true", "yes")
+REPLENISH_THRESHOLD = int(os.getenv("REPLENISH_THRESHOLD", "20"))
+REPLENISH_BATCH_SIZE = int(os.getenv("REPLENISH_BATCH_SIZE", "10"))
+REPLENISH_INTERVAL = int(os.getenv("REPLENISH_INTERVAL", "300"))
+REPLENISH_QUESTION_TYPE = os.getenv("REPLENISH_QUESTION_TYPE", "mcq")
+# Buckets kept stocked even while they hold no questions: every combination of
+# these comma-separated topics, difficulties, skill types and managerial levels
+# (an empty level entry means no level). Buckets that already have questions
+# are topped up whether or not they are listed.
+REPLENISH_TOPICS = [t.strip() for t in os.getenv("REPLENISH_TOPICS", "").split(",") if t.strip()]
+REPLENISH_DIFFICULTIES = [d.strip() for d in os.getenv(
+    "REPLENISH_DIFFICULTIES", ",".join(d.value for d in DifficultyLevel)
+).split(",") if d.strip()]
+REPLENISH_SKILL_TYPES = [s.strip() for s in os.getenv(
+    "REPLENISH_SKILL_TYPES", ",".join(s.value for s in SkillType)
+).split(",") if s.strip()]
+REPLENISH_MANAGERIAL_LEVELS = [level.strip() or None for level in os.getenv("REPLENISH_MANAGERIAL_LEVELS", "").split(",")]
+
+ACTIVE_STATUSES = ("queued", "running")
+# pg advisory lock held for a replenish pass, so only one process at a time
+# decides which buckets need a job
+REPLENISH_LOCK_KEY = 0x7265706C  # "repl"
+
+def retry_delay(attempts: int) -> float:
+    return min(GENERATION_JOB_RETRY_DELAY * 2 ** max(0, attempts - 1), GENERATION_JOB_RETRY_MAX_DELAY)
+
+def _is_due(now: datetime):
+    return or_(GenerationJobORM.not_before.is_(None), GenerationJobORM.not_before <= now)
+
+class GenerationJobQueue:
+    def __init__(self, workers: int = GENERATION_WORKERS):
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Job ids waiting in this process's queue, and those being run by it
+        self._queued: Set[str] = set()
+        self._running: Set[str] = set()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+        self._tasks.append(asyncio.create_task(self._heartbeat_loop()))
+        if REPLENISH_ENABLED:
+            self._tasks.append(asyncio.create_task(self._replenish_loop()))
+        logger.info(f"Generation job queue started with {self.workers} workers (replenisher={'on' if REPLENISH_ENABLED else 'off'})")
+
+    async def stop(self):
+        interrupted = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        if interrupted:
+            # Hand interrupted jobs back so the next worker to start runs them
+            await self._set_status(interrupted, status="queued")
+            logger.info(f"Returned {len(interrupted)} interrupted generation jobs to the queue")
+
+    def _enqueue(self, job_id: str):
+        if self._queue is not None and job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def submit(self, request: QuestionBatchRequest, source: str = "api") -> GenerationJobORM:
+        now = datetime.utcnow()
+        job = GenerationJobORM(
+            id=str(uuid.uuid4()),
+            status="queued",
+            source=source,
+            request=request.model_dump(mode="json"),
+            attempts=0,
+            created_at=now,
+            updated_at=now
+        )
+        async with AsyncSessionLocal() as session:
+            session.add(job)
+            await session.commit()
+        self._enqueue(job.id)
+        logger.info(f"Queued generation job {job.id} ({source}): {request.num_questions} {request.question_type.value} on '{request.topic}'")
+        return job
+
+    async def get(self, job_id: str) -> Optional[GenerationJobOut]:
+        async with AsyncSessionLocal() as session:
+            job = await session.get(GenerationJobORM, job_id)
+            if not job:
+                return None
+            out = GenerationJobOut.model_validate(job)
+            if job.question_ids:
+                result = await session.execute(
+                    async_select(QuestionORM).where(QuestionORM.id.in_(job.question_ids))
+                )
+                out.questions = [QuestionOut.model_validate(q) for q in result.scalars().all()]
+        return out
+
+    async def _set_status(self, job_ids: List[str], **values):
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(GenerationJobORM)
+                .where(GenerationJobORM.id.in_(job_ids))
+                .values(updated_at=datetime.utcnow(), **values)
+            )
+            await session.commit()
+
+    async def _recover(self):
+        # Requeues running jobs whose worker died, then picks up every queued
+        # job. Safe to run from several processes: _claim lets only one run a job.
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(GenerationJobORM)
+                .where(
+                    GenerationJobORM.status == "running",
+                    GenerationJobORM.updated_at < now - timedelta(seconds=GENERATION_JOB_STALE_AFTER)
+                )
+                .values(status="queued", updated_at=now)
+            )
+            await session.commit()
+            result = await session.execute(
+                async_select(GenerationJobORM.id)
+                .where(GenerationJobORM.status == "queued", _is_due(now))
+                .order_by(GenerationJobORM.created_at)
+            )
+            for job_id in result.scalars().all():
+                self._enqueue(job_id)
+
+    async def _claim(self, job_id: str):
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                update(GenerationJobORM)
+                .where(GenerationJobORM.id == job_id, GenerationJobORM.status == "queued", _is_due(now))
+                .values(
+                    status="running",
+                    attempts=GenerationJobORM.attempts + 1,
+                    started_at=now,
+                    updated_at=now
+                )
+                .returning(GenerationJobORM.request, GenerationJobORM.attempts)
+            )
+            claimed = result.first()
+            await session.commit()
+        return claimed
+
+    async def _run(self, job_id: str):
+        claimed = await self._claim(job_id)
+        if not claimed:
+            # Already taken by another worker, or no longer queued
+            return
+        request_data, attempts = claimed
+        self._running.add(job_id)
+        try:
+            created = await generate_questions(QuestionBatchRequest(**request_data))
+            await self._set_status(
+                [job_id],
+                status="succeeded",
+                question_ids=[q.id for q in created],
+                error=None,
+                finished_at=datetime.utcnow()
+            )
+            logger.info(f"Generation job {job_id} created {len(created)} questions")
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            if attempts < GENERATION_JOB_MAX_ATTEMPTS:
+                delay = retry_delay(attempts)
+                logger.warning(f"Generation job {job_id} attempt {attempts} failed, retrying in {delay:.0f}s: {detail}")
+                await self._set_status(
+                    [job_id], status="queued", error=detail,
+                    not_before=datetime.utcnow() + timedelta(seconds=delay)
+                )
+                # Picked up here after the delay, or by any worker's sweep once due
+                asyncio.get_running_loop().call_later(delay, self._enqueue, job_id)
+            else:
+                logger.error(f"Generation job {job_id} failed after {attempts} attempts: {detail}")
+                await self._set_status([job_id], status="failed", error=detail, finished_at=datetime.utcnow())
+        finally:
+            self._running.discard(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error(f"Generation worker error on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(GENERATION_JOB_SWEEP_INTERVAL)
+            try:
+                await self._recover()
+            except Exception as e:
+                logger.warning(f"Generation job sweep failed: {e}")
+
+    async def replenish(self) -> int:
+        # Every worker process runs the replenisher; the one holding the
+        # advisory lock does the pass and the others skip it. The lock is
+        # transaction scoped, so it is released when the session closes even
+        # if the pass fails.
+        async with AsyncSessionLocal() as lock_session:
+            result = await lock_session.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": REPLENISH_LOCK_KEY}
+            )
+            if not result.scalar():
+                logger.debug("Replenish pass skipped: another process holds the lock")
+                return 0
+            return await self._replenish()
+
+    async def _replenish(self) -> int:
+        # Queues a top-up for every configured or existing bucket whose
+        # question count is below the threshold and that has no replenisher
+        # job in flight
+        columns = (QuestionORM.topic, QuestionORM.difficulty, QuestionORM.skill_type, QuestionORM.managerial_level)
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                async_select(*columns, func.count(QuestionORM.id))
+                .where(QuestionORM.type == REPLENISH_QUESTION_TYPE)
+                .group_by(*columns)
+            )
+            counts = {tuple(row[:4]): row[4] for row in result.all()}
+            # Configured buckets with no questions at all are the ones most in need
+            for key in itertools.product(
+                REPLENISH_TOPICS, REPLENISH_DIFFICULTIES, REPLENISH_SKILL_TYPES, REPLENISH_MANAGERIAL_LEVELS
+            ):
+                counts.setdefault(key, 0)
+            active = await session.execute(
+                async_select(GenerationJobORM.request).where(
+                    GenerationJobORM.source == "replenisher",
+                    GenerationJobORM.status.in_(ACTIVE_STATUSES)
+                )
+            )
+            in_flight = {
+                (r.get("topic"), r.get("difficulty"), r.get("skill_type"), r.get("managerial_level"))
+                for r in active.scalars().all()
+            }
+
+        difficulties = {d.value for d in DifficultyLevel}
+        skill_types = {s.value for s in SkillType}
+        submitted = 0
+        for key, count in counts.items():
+            topic, difficulty, skill_type, managerial_level = key
+            if count >= REPLENISH_THRESHOLD or key in in_flight:
+                continue
+            if not topic or difficulty not in difficulties or skill_type not in skill_types:
+                continue
+            await self.submit(
+                QuestionBatchRequest(
+                    topic=topic,
+                    difficulty=difficulty,
+                    skill_type=skill_type,
+                    managerial_level=managerial_level,
+                    num_questions=REPLENISH_BATCH_SIZE,
+                    question_type=QuestionType(REPLENISH_QUESTION_TYPE)
+                ),
+                source="replenisher"
+            )
+            submitted += 1
+        if submitted:
+            logger.info(f"Replenisher queued {submitted} generation jobs")
+        return submitted
+
+    async def _heartbeat(self):
+        # Only rows still running; a job this process lost to a sweep is left alone
+        job_ids = list(self._running)
+        if not job_ids:
+            return
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(GenerationJobORM)
+                .where(GenerationJobORM.id.in_(job_ids), GenerationJobORM.status == "running")
+                .values(updated_at=datetime.utcnow())
+            )
+            await session.commit()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(GENERATION_JOB_HEARTBEAT_INTERVAL)
+            try:
+                await self._heartbeat()
+            except Exception as e:
+                logger.warning(f"Generation job heartbeat failed: {e}")
+
+    async def _replenish_loop(self):
+        while True:
+            try:
+                await self.replenish()
+            except Exception as e:
+                logger.warning(f"Question replenishment failed: {e}")
+            await asyncio.sleep(REPLENISH_INTERVAL)
+
+generation_jobs = GenerationJobQueue()
@@ -1,29 +1,599 @@
 import os
+import json
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
 import httpx
 from fastapi import HTTPException
 from dotenv import load_dotenv
 
+from services import metrics, tracing
+from utils.tokens import estimate_tokens, LLM_CONTEXT_WINDOW, LLM_MAX_TOKENS
+
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_MODEL = "llama3-70b-8192"
-
-async def call_groq_llm(prompt: str) -> str:
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": GROQ_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.7,
-        "max_tokens": 1800,
-    }
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.post("https://api.groq.com/openai/v1/chat/completions", json=payload, headers=headers)
-    
-    if resp.status_code != 200:
-        raise HTTPException(status_code=500, detail=f"GROQ API error: {resp.text}")
-    
-    data = resp.json()
-    content = data["choices"][0]["message"]["content"]
-    return content
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama3-70b-8192")
+# Point at a local OpenAI-compatible server to test against injected latency or 429s
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+
+# Connection pool settings for the shared LLM client
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "10"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Ordered list of OpenAI-compatible chat completion backends, as JSON:
+#   [{"name": "groq", "url": "https://...", "model": "...", "api_key_env": "GROQ_API_KEY"}, ...]
+# ("api_key" may be given inline instead of "api_key_env"). Defaults to Groq alone.
+LLM_BACKENDS = os.getenv("LLM_BACKENDS")
+
+# Hedging: when the primary backend has not answered within this percentile of
+# its recent latencies, the same request is sent to the next backend as well
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+# Hedge delay used until a backend has LLM_HEDGE_MIN_SAMPLES latencies recorded
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Extra in-flight copies a single call may start
+LLM_HEDGE_MAX = int(os.getenv("LLM_HEDGE_MAX", "1"))
+# Generation completions are long and costly to duplicate, so only grading is hedged by default
+LLM_HEDGE_GENERATION = os.getenv("LLM_HEDGE_GENERATION", "false").lower() in ("1", "true", "yes")
+# Recent successful latencies kept per backend
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+# Adaptive concurrency limit (AIMD), kept separately for each backend
+LLM_CONCURRENCY_INITIAL = int(os.getenv("LLM_CONCURRENCY_INITIAL", "8"))
+LLM_CONCURRENCY_MIN = int(os.getenv("LLM_CONCURRENCY_MIN", "1"))
+LLM_CONCURRENCY_MAX = int(os.getenv("LLM_CONCURRENCY_MAX", str(LLM_MAX_CONNECTIONS)))
+# Calls slower than this many seconds count as congestion and shrink the limit
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", "10"))
+# Share of the limit generation calls may hold, keeping headroom for quiz grading
+LLM_GENERATION_SHARE = float(os.getenv("LLM_GENERATION_SHARE", "0.75"))
+# Retries after 429, 5xx or transport errors, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+# Longest wait before a retry; a larger Retry-After fails the call instead
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Consecutive failures that open the circuit, and seconds before it lets a probe through
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+# Priority classes; lower values are admitted first when calls queue for a slot
+PRIORITY_GRADING = 0
+PRIORITY_GENERATION = 1
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = LLM_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("LLM_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=LLM_CONNECT_TIMEOUT,
+            read=LLM_READ_TIMEOUT,
+            write=LLM_READ_TIMEOUT,
+            pool=LLM_POOL_TIMEOUT,
+        ),
+    )
+
+async def init_llm_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+        logger.info(
+            f"LLM client ready (max_connections={LLM_MAX_CONNECTIONS}, "
+            f"keepalive={LLM_MAX_KEEPALIVE_CONNECTIONS}, http2={LLM_HTTP2})"
+        )
+    return _client
+
+async def close_llm_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("LLM client closed")
+
+def get_llm_client() -> httpx.AsyncClient:
+    # Normally created by the startup hook; created lazily for scripts that skip it
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+class LLMUnavailableError(HTTPException):
+    # The provider is overloaded or failing; callers with a fallback should use it
+    def __init__(self, detail: str):
+        super().__init__(status_code=503, detail=detail)
+
+class AdaptiveLimiter:
+    # AIMD concurrency limit: grows by about one slot per limit's worth of
+    # healthy calls and halves on 429s, 5xx, timeouts or calls slower than the
+    # latency target. Waiting calls are admitted in priority order, and
+    # lower-priority calls may only fill a share of the limit.
+    def __init__(
+        self,
+        initial: int = LLM_CONCURRENCY_INITIAL,
+        min_limit: int = LLM_CONCURRENCY_MIN,
+        max_limit: int = LLM_CONCURRENCY_MAX,
+        latency_target: float = LLM_LATENCY_TARGET,
+        low_priority_share: float = LLM_GENERATION_SHARE
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_target = latency_target
+        self.low_priority_share = low_priority_share
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._last_decrease = 0.0
+
+    def _capacity(self, priority: int) -> int:
+        limit = max(1, int(self.limit))
+        if priority > PRIORITY_GRADING:
+            return max(1, int(limit * self.low_priority_share))
+        return limit
+
+    def _wake(self):
+        while self._waiters:
+            priority, _, waiter = self._waiters[0]
+            if waiter.done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= self._capacity(priority):
+                break
+            heapq.heappop(self._waiters)
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    async def acquire(self, priority: int = PRIORITY_GENERATION):
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+        self._wake()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just before being cancelled
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self, latency: float):
+        if latency > self.latency_target:
+            self.on_congestion()
+            return
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def on_congestion(self):
+        # Calls in flight when congestion starts tend to fail together; back
+        # off once per burst rather than once per failed call
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit / 2)
+        logger.info(f"LLM concurrency limit lowered to {int(self.limit)}")
+
+class CircuitBreaker:
+    # Opens after `threshold` consecutive failures and rejects calls until
+    # `reset_after` seconds have passed. It then lets a single probe through,
+    # closing again if the probe succeeds and reopening if it fails.
+    def __init__(self, threshold: int = LLM_BREAKER_FAILURES, reset_after: float = LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_after:
+                return False
+            self.state = "half_open"
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("LLM circuit closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+            logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        # The probe ended without an outcome (e.g. it was cancelled)
+        self._probing = False
+
+    def available(self) -> bool:
+        # Whether allow() would let a call through, without claiming the probe
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self._opened_at >= self.reset_after
+        return not self._probing
+
+def _outcome(status_code: Optional[int]) -> str:
+    if status_code is None:
+        return "transport_error"
+    if status_code == 200:
+        return "ok"
+    if status_code == 429:
+        return "rate_limited"
+    return "server_error" if status_code >= 500 else "client_error"
+
+class LLMBackend:
+    # One OpenAI-compatible chat completions endpoint, with its own
+    # concurrency limit, circuit breaker and latency history
+    def __init__(self, name: str, url: str, model: str, api_key: Optional[str]):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.limiter = AdaptiveLimiter()
+        self.breaker = CircuitBreaker()
+        self.latencies: deque = deque(maxlen=LLM_LATENCY_WINDOW)
+
+    def chat_request(self, prompt: str, stream: bool = False, max_tokens: Optional[int] = None) -> Tuple[dict, dict]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.7,
+            "max_tokens": min(max_tokens or LLM_MAX_TOKENS, LLM_MAX_TOKENS),
+        }
+        if stream:
+            payload["stream"] = True
+        return headers, payload
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return self.latency_percentile(LLM_HEDGE_PERCENTILE)
+
+    @asynccontextmanager
+    async def _slot(self, priority: int):
+        if not self.breaker.allow():
+            raise LLMUnavailableError(f"LLM backend '{self.name}' circuit is open; failing fast")
+        try:
+            await self.limiter.acquire(priority)
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        try:
+            yield
+        finally:
+            self.limiter.release()
+
+    def _record(self, status_code: Optional[int], latency: float):
+        # None means a transport error or timeout
+        metrics.llm_call_duration.observe(latency, backend=self.name, outcome=_outcome(status_code))
+        if status_code is None or status_code >= 500:
+            self.limiter.on_congestion()
+            self.breaker.record_failure()
+        elif status_code == 429:
+            self.limiter.on_congestion()
+            self.breaker.release_probe()
+        else:
+            if status_code == 200:
+                self.latencies.append(latency)
+            self.limiter.on_success(latency)
+            self.breaker.record_success()
+
+    async def _send(self, headers: dict, payload: dict, priority: int) -> httpx.Response:
+        async with self._slot(priority):
+            started = time.monotonic()
+            recorded = False
+            try:
+                with tracing.span(
+                    "llm.call", tracing.KIND_CLIENT,
+                    **{"llm.backend": self.name, "llm.model": self.model, "llm.max_tokens": payload.get("max_tokens")}
+                ) as call_span:
+                    try:
+                        resp = await get_llm_client().post(self.url, json=payload, headers=headers)
+                    except httpx.TransportError:
+                        self._record(None, time.monotonic() - started)
+                        recorded = True
+                        raise
+                    call_span.set("http.status_code", resp.status_code)
+                self._record(resp.status_code, time.monotonic() - started)
+                recorded = True
+                return resp
+            finally:
+                if not recorded:
+                    self.breaker.release_probe()
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> Optional[float]:
+        # Returns None when the server asks for a longer wait than LLM_BACKOFF_MAX
+        if retry_after:
+            try:
+                wait = float(retry_after)
+            except ValueError:
+                wait = None
+            if wait is not None:
+                if wait > LLM_BACKOFF_MAX:
+                    return None
+                # Jitter keeps calls that got the same Retry-After from retrying in lockstep
+                return wait + random.uniform(0, LLM_BACKOFF_BASE)
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+    async def complete(self, prompt: str, priority: int, max_tokens: Optional[int] = None) -> str:
+        headers, payload = self.chat_request(prompt, max_tokens=max_tokens)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            last_attempt = attempt == LLM_MAX_RETRIES
+            try:
+                resp = await self._send(headers, payload, priority)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise LLMUnavailableError(f"LLM backend '{self.name}' request failed: {e!r}")
+                delay = self._backoff(attempt, None)
+                reason = "transport_error"
+            else:
+                if resp.status_code == 200:
+                    data = resp.json()
+                    self._log_usage(prompt, payload["max_tokens"], data.get("usage"))
+                    return data["choices"][0]["message"]["content"]
+                if resp.status_code != 429 and resp.status_code < 500:
+                    raise HTTPException(status_code=500, detail=f"LLM backend '{self.name}' error: {resp.text}")
+                delay = None if last_attempt else self._backoff(attempt, resp.headers.get("retry-after"))
+                if delay is None:
+                    if resp.status_code == 429:
+                        # Still rate limited after backing off: count it against the circuit
+                        self.breaker.record_failure()
+                    raise LLMUnavailableError(f"LLM backend '{self.name}' error {resp.status_code}: {resp.text[:200]}")
+                reason = _outcome(resp.status_code)
+            metrics.llm_retries.inc(backend=self.name, reason=reason)
+            logger.info(f"Retrying '{self.name}' in {delay:.1f}s (attempt {attempt + 2}/{LLM_MAX_RETRIES + 1})")
+            await asyncio.sleep(delay)
+
+    def _log_usage(self, prompt: str, max_tokens: int, usage: Optional[dict]):
+        # Local estimate next to the provider's count, for tuning the token budgets
+        actual = ""
+        if usage:
+            actual = f" (actual {usage.get('prompt_tokens')} prompt, {usage.get('completion_tokens')} completion)"
+        logger.info(f"LLM '{self.name}': ~{estimate_tokens(prompt)} prompt tokens, max_tokens={max_tokens}{actual}")
+
+    @asynccontextmanager
+    async def stream(self, prompt: str, priority: int, max_tokens: Optional[int] = None):
+        # Streams are not retried: output may already have been forwarded
+        headers, payload = self.chat_request(prompt, stream=True, max_tokens=max_tokens)
+        self._log_usage(prompt, payload["max_tokens"], None)
+        async with self._slot(priority):
+            started = time.monotonic()
+            recorded = False
+            try:
+                try:
+                    async with get_llm_client().stream("POST", self.url, json=payload, headers=headers) as resp:
+                        self._record(resp.status_code, time.monotonic() - started)
+                        recorded = True
+                        if resp.status_code != 200:
+                            body = await resp.aread()
+                            detail = f"LLM backend '{self.name}' error: {body.decode(errors='replace')}"
+                            if resp.status_code == 429 or resp.status_code >= 500:
+                                raise LLMUnavailableError(detail)
+                            raise HTTPException(status_code=500, detail=detail)
+                        yield resp
+                except httpx.TransportError as e:
+                    if not recorded:
+                        self._record(None, time.monotonic() - started)
+                        recorded = True
+                    raise LLMUnavailableError(f"LLM backend '{self.name}' stream failed: {e!r}")
+            finally:
+                if not recorded:
+                    self.breaker.release_probe()
+
+    def stats(self) -> dict:
+        p50 = self.latency_percentile(50)
+        p90 = self.latency_percentile(90)
+        return {
+            "name": self.name,
+            "concurrency_limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "waiting": sum(1 for _, _, waiter in self.limiter._waiters if not waiter.done()),
+            "circuit": self.breaker.state,
+            "latency_samples": len(self.latencies),
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p90": round(p90, 3) if p90 is not None else None,
+        }
+
+def load_backends() -> List[LLMBackend]:
+    if not LLM_BACKENDS:
+        return [LLMBackend("groq", GROQ_API_URL, GROQ_MODEL, GROQ_API_KEY)]
+    backends = []
+    for idx, entry in enumerate(json.loads(LLM_BACKENDS)):
+        api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", ""))
+        backends.append(LLMBackend(
+            entry.get("name", f"backend{idx}"),
+            entry["url"],
+            entry.get("model", GROQ_MODEL),
+            api_key
+        ))
+    if not backends:
+        raise ValueError("LLM_BACKENDS must list at least one backend")
+    return backends
+
+class LLMGateway:
+    def __init__(self, backends: List[LLMBackend]):
+        self.backends = backends
+        self.hedged = 0
+        self.secondary_wins = 0
+
+    def ranked(self) -> List[LLMBackend]:
+        # Backends whose circuit would let a call through come first. Among
+        # those with enough latency samples, the fastest median leads; the
+        # rest keep their configured order behind them.
+        def rank(item):
+            idx, backend = item
+            median = backend.latency_percentile(50) if len(backend.latencies) >= LLM_HEDGE_MIN_SAMPLES else None
+            return (not backend.breaker.available(), median is None, median or 0.0, idx)
+        return [backend for _, backend in sorted(enumerate(self.backends), key=rank)]
+
+    async def complete(self, prompt: str, priority: int, max_tokens: Optional[int] = None) -> str:
+        # Sends to the primary backend and, if it has not answered within its
+        # hedge delay, to the next backend too, taking whichever answers first.
+        # A backend that fails outright is replaced by the next one right away.
+        with tracing.span("llm.request", **{"llm.priority": priority}) as request_span:
+            content, backend = await self._complete(prompt, priority, max_tokens)
+            request_span.set("llm.backend", backend.name)
+        return content
+
+    async def _complete(self, prompt: str, priority: int, max_tokens: Optional[int]) -> Tuple[str, LLMBackend]:
+        ranked = self.ranked()
+        primary = ranked[0]
+        remaining = list(ranked)
+        hedging = len(ranked) > 1 and (priority == PRIORITY_GRADING or LLM_HEDGE_GENERATION)
+        delay = primary.hedge_delay()
+        pending: Dict[asyncio.Task, LLMBackend] = {}
+        hedges = 0
+        last_error: Optional[BaseException] = None
+
+        def launch():
+            backend = remaining.pop(0)
+            pending[asyncio.create_task(backend.complete(prompt, priority, max_tokens))] = backend
+
+        launch()
+        try:
+            while pending:
+                can_hedge = hedging and remaining and hedges < LLM_HEDGE_MAX
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedges += 1
+                    self.hedged += 1
+                    metrics.llm_hedges.inc()
+                    logger.info(f"No answer from '{primary.name}' after {delay:.2f}s; hedging to '{remaining[0].name}'")
+                    launch()
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    try:
+                        content = task.result()
+                    except Exception as e:
+                        logger.warning(f"LLM backend '{backend.name}' failed: {e}")
+                        last_error = e
+                        continue
+                    if backend is not primary:
+                        self.secondary_wins += 1
+                    return content, backend
+                if not pending and remaining:
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @asynccontextmanager
+    async def stream(self, prompt: str, priority: int, max_tokens: Optional[int] = None):
+        # Uses the first backend that can take the call; there is no hedging
+        # because output is forwarded as it arrives. A backend that fails before
+        # the stream opens is replaced by the next one; once output has been
+        # forwarded, failures are the caller's to handle.
+        last_error: Optional[LLMUnavailableError] = None
+        for backend in self.ranked():
+            if not backend.breaker.available():
+                continue
+            opened = False
+            try:
+                async with backend.stream(prompt, priority, max_tokens) as resp:
+                    opened = True
+                    yield resp
+                return
+            except LLMUnavailableError as e:
+                if opened:
+                    raise
+                logger.warning(f"LLM backend '{backend.name}' failed to open a stream: {e.detail}")
+                last_error = e
+        raise last_error or LLMUnavailableError("All LLM backends are unavailable")
+
+    def stats(self) -> dict:
+        return {
+            "hedged": self.hedged,
+            "secondary_wins": self.secondary_wins,
+            "backends": [backend.stats() for backend in self.backends],
+        }
+
+llm_gateway = LLMGateway(load_backends())
+
+def _check_context(prompt: str, max_tokens: Optional[int]):
+    needed = estimate_tokens(prompt) + (max_tokens or LLM_MAX_TOKENS)
+    if needed > LLM_CONTEXT_WINDOW:
+        logger.warning(f"Estimated {needed} tokens exceeds the {LLM_CONTEXT_WINDOW}-token context window")
+
+async def call_groq_llm(
+    prompt: str,
+    priority: int = PRIORITY_GENERATION,
+    max_tokens: Optional[int] = None
+) -> str:
+    # max_tokens defaults to LLM_MAX_TOKENS; callers size it with utils.tokens.completion_budget
+    _check_context(prompt, max_tokens)
+    return await llm_gateway.complete(prompt, priority, max_tokens)
+
+async def stream_groq_llm(
+    prompt: str,
+    priority: int = PRIORITY_GENERATION,
+    max_tokens: Optional[int] = None
+) -> AsyncIterator[str]:
+    # Yields content deltas from the provider's server-sent event stream
+    _check_context(prompt, max_tokens)
+    async with llm_gateway.stream(prompt, priority, max_tokens) as resp:
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
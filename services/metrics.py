@@ -0,0 +1,164 @@
+import os
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Latency buckets in seconds, from fast DB reads up to slow LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+LabelValues = Tuple[str, ...]
+
+_registry: List["_Metric"] = []
+_lock = threading.Lock()
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+class Gauge(_Metric):
+    # Either set explicitly or read from `callback` at scrape time. A callback
+    # returns a number, or a dict of label-value tuples to numbers.
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), callback: Optional[Callable] = None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        values = self._values
+        if self.callback is not None:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> (per-bucket counts, sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with _lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+def render() -> str:
+    # Prometheus text exposition format, version 0.0.4
+    with _lock:
+        return "\n".join(metric.render() for metric in _registry) + "\n"
+
+# HTTP
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status")
+)
+db_statements_per_request = Histogram(
+    "db_statements_per_request", "SQL statements executed per request", ("route",), buckets=COUNT_BUCKETS
+)
+db_time_per_request = Histogram(
+    "db_time_per_request_seconds", "Time spent executing SQL statements per request", ("route",)
+)
+
+# LLM
+llm_call_duration = Histogram(
+    "llm_call_duration_seconds", "LLM HTTP call latency by backend and outcome", ("backend", "outcome")
+)
+llm_retries = Counter("llm_retries_total", "LLM calls retried after a failed attempt", ("backend", "reason"))
+llm_hedges = Counter("llm_hedged_requests_total", "LLM calls duplicated to a secondary backend")
+generation_parse_failures = Counter(
+    "generation_parse_failures_total", "Generation responses that could not be parsed as a JSON array"
+)
+generation_items = Counter(
+    "generation_items_total", "Questions requested from and accepted out of generation calls", ("result",)
+)
+
+# Quizzes
+evaluations = Counter("evaluations_total", "Graded answers by evaluation method", ("method",))
+quiz_size = Histogram("quiz_questions", "Answers submitted per quiz evaluation", buckets=COUNT_BUCKETS)
+
+# Reference data
+reference_data_lookups = Counter(
+    "reference_data_lookups_total", "Reference data lookups found (hit) or not found (miss) in memory", ("table", "result")
+)
+reference_data_reloads = Counter("reference_data_reloads_total", "Reference data table reloads by trigger", ("table", "trigger"))
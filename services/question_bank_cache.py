@@ -0,0 +1,234 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Awaitable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.future import select as async_select
+
+from database import ReadSessionLocal
+from models import QuestionORM
+from schemas import QuestionForEvaluation
+
+logger = logging.getLogger(__name__)
+
+QUESTION_BANK_CACHE_ENABLED = os.getenv("QUESTION_BANK_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Upper bound on questions held in memory across all loaded buckets
+QUESTION_BANK_CACHE_MAX_QUESTIONS = int(os.getenv("QUESTION_BANK_CACHE_MAX_QUESTIONS", "50000"))
+# Seconds before the bucket index and loaded buckets are re-read, so rows written
+# by other workers show up
+QUESTION_BANK_CACHE_TTL = int(os.getenv("QUESTION_BANK_CACHE_TTL", "300"))
+
+# (topic, difficulty, skill_type, managerial_level, type)
+BucketKey = Tuple[Optional[str], Optional[str], Optional[str], Optional[str], str]
+
+BUCKET_COLUMNS = (
+    QuestionORM.topic,
+    QuestionORM.difficulty,
+    QuestionORM.skill_type,
+    QuestionORM.managerial_level,
+    QuestionORM.type,
+)
+
+def bucket_key(q) -> BucketKey:
+    return (q.topic, q.difficulty, q.skill_type, q.managerial_level, q.type)
+
+def _bucket_clause(key: BucketKey):
+    return and_(*[
+        column.is_(None) if value is None else column == value
+        for column, value in zip(BUCKET_COLUMNS, key)
+    ])
+
+def _log_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Question bank cache refresh failed: {task.exception()}")
+
+def to_quiz_question(q: QuestionORM) -> QuestionForEvaluation:
+    return QuestionForEvaluation(
+        id=q.id,
+        question_text=q.question_text,
+        type=q.type,
+        topic=q.topic,
+        difficulty=q.difficulty,
+        skill_type=q.skill_type,
+        managerial_level=q.managerial_level,
+        options=q.options if q.type == "mcq" else None
+    )
+
+class _Bucket:
+    # Questions of one bucket as a list, so a quiz can be sampled by index
+    # without copying, plus their ids for deduplicating add()
+    __slots__ = ("questions", "ids", "loaded_at")
+
+    def __init__(self, questions: List[QuestionForEvaluation], loaded_at: float):
+        self.questions = questions
+        self.ids = {q.id for q in questions}
+        self.loaded_at = loaded_at
+
+def _sample_across(buckets: List[_Bucket], k: int) -> List[QuestionForEvaluation]:
+    # Uniform sample of k questions from the concatenation of the buckets
+    ends = list(accumulate(len(bucket.questions) for bucket in buckets))
+    total = ends[-1] if ends else 0
+    picked = []
+    for i in random.sample(range(total), min(k, total)):
+        b = bisect_right(ends, i)
+        picked.append(buckets[b].questions[i - (ends[b - 1] if b else 0)])
+    return picked
+
+class QuestionBankCache:
+    # Quiz starts never wait on the database for data the cache already holds:
+    # an expired index or bucket keeps being served while one background load
+    # replaces it. Only a bucket that was never loaded is waited for, and
+    # concurrent requests for it share a single load.
+    def __init__(self, max_questions: int = QUESTION_BANK_CACHE_MAX_QUESTIONS, ttl: int = QUESTION_BANK_CACHE_TTL):
+        self.max_questions = max_questions
+        self.ttl = ttl
+        # Row count of every bucket in the bank; cheap to hold in full
+        self._index: Dict[BucketKey, int] = {}
+        self._index_loaded_at = 0.0
+        self._index_task: Optional[asyncio.Task] = None
+        # Loaded buckets in least-recently-used order
+        self._buckets: "OrderedDict[BucketKey, _Bucket]" = OrderedDict()
+        # In-flight bucket loads, shared by every request that needs the bucket
+        self._loading: Dict[BucketKey, asyncio.Task] = {}
+        self._size = 0
+
+    async def load_index(self):
+        async with ReadSessionLocal() as session:
+            result = await session.execute(
+                async_select(*BUCKET_COLUMNS, func.count(QuestionORM.id)).group_by(*BUCKET_COLUMNS)
+            )
+            index = {tuple(row[:5]): row[5] for row in result.all()}
+        # Swapped in whole; readers see the old index or the new one
+        self._index = index
+        self._index_loaded_at = time.monotonic()
+        logger.info(f"Question bank index loaded: {len(self._index)} buckets, {sum(self._index.values())} questions")
+
+    def _refresh_index(self):
+        if self._index_task is None or self._index_task.done():
+            self._index_task = asyncio.create_task(self.load_index())
+            self._index_task.add_done_callback(_log_failure)
+
+    def _matching(self, topic, difficulty, skill_type, managerial_level, question_type) -> List[BucketKey]:
+        wanted = (topic, difficulty, skill_type, managerial_level, question_type)
+        return [
+            key for key in self._index
+            if all(value is None or key[i] == value for i, value in enumerate(wanted))
+        ]
+
+    async def _load_buckets(self, keys: List[BucketKey]):
+        loaded: Dict[BucketKey, List[QuestionForEvaluation]] = {key: [] for key in keys}
+        async with ReadSessionLocal() as session:
+            result = await session.execute(
+                async_select(QuestionORM).where(or_(*[_bucket_clause(key) for key in keys]))
+            )
+            for q in result.scalars().all():
+                loaded.setdefault(bucket_key(q), []).append(to_quiz_question(q))
+        now = time.monotonic()
+        for key, questions in loaded.items():
+            old = self._buckets.pop(key, None)
+            self._size -= len(old.questions) if old is not None else 0
+            self._buckets[key] = _Bucket(questions, now)
+            self._index[key] = len(questions)
+            self._size += len(questions)
+
+    def _load(self, keys: List[BucketKey]) -> Awaitable:
+        # Starts one load for the keys not already loading; the result
+        # completes when every key's load has finished
+        pending = {self._loading[key] for key in keys if key in self._loading}
+        todo = [key for key in keys if key not in self._loading]
+        if todo:
+            task = asyncio.create_task(self._load_buckets(todo))
+            for key in todo:
+                self._loading[key] = task
+
+            def _done(finished: asyncio.Task, todo=todo):
+                for key in todo:
+                    if self._loading.get(key) is finished:
+                        del self._loading[key]
+
+            task.add_done_callback(_done)
+            pending.add(task)
+        return asyncio.gather(*pending)
+
+    def _evict(self, keep: Iterable[BucketKey] = ()):
+        keep = set(keep)
+        for key in list(self._buckets):
+            if self._size <= self.max_questions:
+                break
+            if key in keep:
+                continue
+            self._size -= len(self._buckets.pop(key).questions)
+
+    async def sample(
+        self,
+        k: int,
+        topic: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        skill_type: Optional[str] = None,
+        managerial_level: Optional[str] = None,
+        question_type: Optional[str] = None
+    ) -> Optional[List[QuestionForEvaluation]]:
+        # Returns None when the caller should sample from the database
+        # instead: the matching buckets do not fit in the cache, or the cache
+        # cannot supply k questions. The index is only refreshed every ttl
+        # seconds, so buckets created by other workers may not be in it yet.
+        if k <= 0:
+            return []
+        now = time.monotonic()
+        if now - self._index_loaded_at > self.ttl:
+            self._refresh_index()
+
+        keys = self._matching(topic, difficulty, skill_type, managerial_level, question_type)
+        if not keys or sum(self._index.get(key, 0) for key in keys) > self.max_questions:
+            return None
+
+        missing = [key for key in keys if key not in self._buckets]
+        expired = [key for key in keys if key in self._buckets and now - self._buckets[key].loaded_at > self.ttl]
+        if expired:
+            asyncio.ensure_future(self._load(expired)).add_done_callback(_log_failure)
+        if missing:
+            await self._load(missing)
+
+        buckets = []
+        for key in keys:
+            # A concurrent request may have evicted it while this one waited
+            if key in self._buckets:
+                self._buckets.move_to_end(key)
+                buckets.append(self._buckets[key])
+        self._evict(keep=keys)
+        picked = _sample_across(buckets, k)
+        return picked if len(picked) == k else None
+
+    def add(self, questions: List[QuestionORM]):
+        # Called after new questions are committed so this worker sees them immediately
+        for q in questions:
+            key = bucket_key(q)
+            self._index[key] = self._index.get(key, 0) + 1
+            bucket = self._buckets.get(key)
+            if bucket is not None and q.id not in bucket.ids:
+                bucket.ids.add(q.id)
+                bucket.questions.append(to_quiz_question(q))
+                self._size += 1
+        self._evict()
+
+    def counts_by_type(self) -> Dict[Tuple[str], int]:
+        counts: Dict[Tuple[str], int] = {}
+        for key, count in self._index.items():
+            counts[(key[4],)] = counts.get((key[4],), 0) + count
+        return counts
+
+    def stats(self) -> dict:
+        return {
+            "buckets": len(self._index),
+            "loaded_buckets": len(self._buckets),
+            "cached_questions": self._size,
+            "max_questions": self.max_questions,
+        }
+
+question_bank_cache = QuestionBankCache()
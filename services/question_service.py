@@ -1,38 +1,92 @@
+import os
 import json
+import math
+import random
+import asyncio
 import logging
-from typing import List, Optional
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Union
 from fastapi import HTTPException
+from sqlalchemy import union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.future import select as async_select
 from datetime import datetime
 
-from database import AsyncSessionLocal
+from database import AsyncSessionLocal, ReadSessionLocal
 from models import QuestionORM, ManagerialRatioORM
 from schemas import (
     MCQQuestionCreate, SubjectiveQuestionCreate, QuestionBatchRequest,
-    QuestionForEvaluation, QuizRequest
+    QuestionForEvaluation, QuestionOut, QuizRequest
+)
+from services import metrics, tracing
+from services.llm_service import call_groq_llm, stream_groq_llm
+from services.question_bank_cache import (
+    question_bank_cache, to_quiz_question, QUESTION_BANK_CACHE_ENABLED
+)
+from services.reference_data import reference_data, MANAGERIAL_RATIOS, REFERENCE_DATA_CACHE_ENABLED
+from services.similarity_index import (
+    SimilarityIndex, question_similarity_index, rank_by_redundancy,
+    fingerprint, QUESTION_SIMILARITY_ENABLED
 )
-from services.llm_service import call_groq_llm
 from utils.helpers import (
-    clean_json_response, build_enhanced_prompt
+    clean_json_response, build_enhanced_prompt, JSONScanner, AVOID_LIST_LIMIT
 )
+from utils.tokens import completion_budget, items_per_completion
 
 logger = logging.getLogger(__name__)
 
-async def get_recent_question_texts(topic: str, skill_type: str, managerial_level: Optional[str], n: int = 10) -> List[str]:
-    query = async_select(QuestionORM).where(
+# Rows read per requested question when sampling; higher is more uniform but reads more rows
+QUESTION_SAMPLE_OVERSAMPLE = int(os.getenv("QUESTION_SAMPLE_OVERSAMPLE", "4"))
+# Separate regions of the sample_key range each quiz draws from
+QUESTION_SAMPLE_PIVOTS = int(os.getenv("QUESTION_SAMPLE_PIVOTS", "8"))
+
+# Sub-batch LLM calls in flight at once for a single generation request
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))
+# Extra rounds asking for the shortfall when merged sub-batches come in short
+GENERATION_TOPUP_ROUNDS = int(os.getenv("GENERATION_TOPUP_ROUNDS", "1"))
+
+async def get_recent_question_texts(
+    topic: str,
+    skill_type: str,
+    managerial_level: Optional[str],
+    n: int = 10,
+    difficulty: Optional[str] = None,
+    question_type: Optional[str] = None
+) -> List[str]:
+    # Picks the stored questions closest to what this request will produce, for
+    # the prompt's AVOID list. The request has no text of its own, so closeness
+    # is by attributes: same topic, skill type and level, preferring the same
+    # difficulty and question type, newest first. When similarity checks are
+    # on, a 4x wider window is read and the questions most similar to the rest
+    # of it (the ones the LLM keeps regenerating) go first.
+    pool_size = n * 4 if QUESTION_SIMILARITY_ENABLED else n
+    query = async_select(QuestionORM.question_text).where(
         QuestionORM.topic == topic,
         QuestionORM.skill_type == skill_type
     )
     if managerial_level:
         query = query.where(QuestionORM.managerial_level == managerial_level)
-    query = query.order_by(QuestionORM.created_at.desc()).limit(n)
+    ordering = []
+    if difficulty:
+        ordering.append((QuestionORM.difficulty == difficulty).desc())
+    if question_type:
+        ordering.append((QuestionORM.type == question_type).desc())
+    query = query.order_by(*ordering, QuestionORM.created_at.desc()).limit(pool_size)
     
     async with AsyncSessionLocal() as session:
         result = await session.execute(query)
-        return [q.question_text for q in result.scalars().all()]
+        texts = list(result.scalars().all())
+    
+    if QUESTION_SIMILARITY_ENABLED:
+        texts = rank_by_redundancy(texts)
+    return texts[:n]
 
 async def get_managerial_ratios(managerial_level: str) -> Optional[dict]:
-    async with AsyncSessionLocal() as session:
+    if REFERENCE_DATA_CACHE_ENABLED:
+        ratios = await reference_data.get(MANAGERIAL_RATIOS, managerial_level)
+        # A copy, so callers cannot change the cached entry later requests read
+        return dict(ratios) if ratios is not None else None
+    async with ReadSessionLocal() as session:
         result = await session.execute(
             async_select(ManagerialRatioORM).where(ManagerialRatioORM.managerial_level == managerial_level)
         )
@@ -42,50 +96,93 @@ async def get_managerial_ratios(managerial_level: str) -> Optional[dict]:
         return None
 
 async def validate_and_retry_llm_call(
-    prompt: str, 
+    build_prompt: Callable[[int, List[str]], str],
+    num_questions: int,
+    validate: Callable[[List[dict]], list],
     max_retries: int = 3,
     question_type: str = "mcq"
-) -> List[dict]:
+) -> list:
+    # Keeps every valid question from each attempt. Follow-up attempts ask only
+    # for the shortfall, with the accepted questions passed to build_prompt to
+    # be listed as ones to avoid. Returns the accepted questions, possibly
+    # fewer than requested; raises only if no attempt yielded a valid one.
+    accepted = []
+    yields = []
+    last_error = None
     for attempt in range(max_retries):
+        wanted = num_questions - len(accepted)
+        if wanted <= 0:
+            break
+        prompt = build_prompt(wanted, [q.question_text for q in accepted])
+        if last_error is not None:
+            prompt += f"\n\nIMPORTANT: Return ONLY valid JSON. Attempt {attempt + 1}."
+            if attempt == max_retries - 1:
+                prompt += "\nNo explanations, no markdown, just clean JSON array."
+        
         try:
-            logger.info(f"LLM call attempt {attempt + 1}/{max_retries}")
-            if attempt > 0:
-                retry_prompt = prompt + f"\n\nIMPORTANT: Return ONLY valid JSON. Attempt {attempt + 1}."
-                if attempt == 2:
-                    retry_prompt += "\nNo explanations, no markdown, just clean JSON array."
-            else:
-                retry_prompt = prompt
-            
-            content = await call_groq_llm(retry_prompt)
+            logger.info(f"LLM call attempt {attempt + 1}/{max_retries} for {wanted} questions")
+            content = await call_groq_llm(prompt, max_tokens=completion_budget(question_type, wanted))
             logger.info(f"LLM response preview: {content[:100]}...")
-            cleaned = clean_json_response(content)
-            batch = json.loads(cleaned)
-            
+            with tracing.span("json.clean", **{"json.input_chars": len(content)}):
+                batch = json.loads(clean_json_response(content))
             if not isinstance(batch, list):
                 raise ValueError("Response is not a JSON array")
-            if len(batch) == 0:
-                raise ValueError("Empty response array")
-            
-            logger.info(f"Successfully parsed {len(batch)} items from LLM response")
-            return batch
+            last_error = None
         except Exception as e:
             logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-            if attempt == max_retries - 1:
-                raise HTTPException(
-                    status_code=500, 
-                    detail=f"Failed to get valid response from LLM after {max_retries} attempts. Last error: {str(e)}"
-                )
+            if not isinstance(e, HTTPException):
+                metrics.generation_parse_failures.inc()
+            last_error = e
+            yields.append(f"0/{wanted}")
             continue
+        
+        valid = validate(batch)
+        accepted.extend(valid)
+        metrics.generation_items.inc(wanted, result="requested")
+        metrics.generation_items.inc(len(valid), result="accepted")
+        yields.append(f"{len(valid)}/{wanted}")
+        logger.info(f"Attempt {attempt + 1}: {len(batch)} items received, {len(valid)}/{wanted} accepted")
+    
+    logger.info(f"Generation yield per attempt: {', '.join(yields)} ({len(accepted)}/{num_questions} total)")
+    if not accepted:
+        reason = str(last_error) if last_error is not None else "no valid questions in response"
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Failed to get valid response from LLM after {max_retries} attempts. Last error: {reason}"
+        )
+    return accepted[:num_questions]
+
+def is_duplicate_question(text: str, seen: set, batch_index: Optional[SimilarityIndex]) -> bool:
+    # Exact repeats within the batch, then near-duplicates of stored questions
+    # or of earlier items in the same batch
+    if text in seen:
+        return True
+    seen.add(text)
+    if batch_index is None:
+        return False
+    fp = fingerprint(text)
+    if question_similarity_index.is_near_duplicate(text, fp) or batch_index.is_near_duplicate(text, fp):
+        logger.info(f"Rejected near-duplicate question: {text[:80]}")
+        return True
+    batch_index.add(None, text, fp)
+    return False
 
-def validate_mcq_batch(batch: List[dict]) -> List[MCQQuestionCreate]:
+def validate_mcq_batch(
+    batch: List[dict],
+    seen: Optional[set] = None,
+    batch_index: Optional[SimilarityIndex] = None
+) -> List[MCQQuestionCreate]:
+    # Pass the same seen set and batch_index across calls to deduplicate a
+    # batch that is validated piece by piece
     valid = []
-    seen = set()
+    seen = set() if seen is None else seen
+    if batch_index is None and QUESTION_SIMILARITY_ENABLED:
+        batch_index = SimilarityIndex()
     for q in batch:
         try:
             text = q.get("question", "").strip()
-            if not text or len(text) < 8 or text in seen:
+            if not text or len(text) < 8 or is_duplicate_question(text, seen, batch_index):
                 continue
-            seen.add(text)
             
             options = q.get("options", [])
             answer = str(q.get("answer", "")).strip()
@@ -104,17 +201,24 @@ def validate_mcq_batch(batch: List[dict]) -> List[MCQQuestionCreate]:
             continue
     return valid
 
-def validate_subjective_batch(batch: List[dict]) -> List[SubjectiveQuestionCreate]:
+def validate_subjective_batch(
+    batch: List[dict],
+    seen: Optional[set] = None,
+    batch_index: Optional[SimilarityIndex] = None
+) -> List[SubjectiveQuestionCreate]:
+    # Pass the same seen set and batch_index across calls to deduplicate a
+    # batch that is validated piece by piece
     valid = []
-    seen = set()
+    seen = set() if seen is None else seen
+    if batch_index is None and QUESTION_SIMILARITY_ENABLED:
+        batch_index = SimilarityIndex()
     for q in batch:
         try:
             text = q.get("question", "").strip()
             answer = q.get("answer", "").strip()
             
-            if not text or not answer or len(text) < 8 or text in seen:
+            if not text or not answer or len(text) < 8 or is_duplicate_question(text, seen, batch_index):
                 continue
-            seen.add(text)
             
             valid.append(SubjectiveQuestionCreate(
                 question_text=text,
@@ -125,146 +229,409 @@ def validate_subjective_batch(batch: List[dict]) -> List[SubjectiveQuestionCreat
             continue
     return valid
 
-async def save_mcq_questions_to_db(questions: List[MCQQuestionCreate], meta: QuestionBatchRequest):
+async def save_questions_to_db(
+    questions: List[Union[MCQQuestionCreate, SubjectiveQuestionCreate]],
+    meta: QuestionBatchRequest
+) -> List[QuestionORM]:
+    # Writes the whole batch with one INSERT ... ON CONFLICT (question_text)
+    # DO NOTHING RETURNING. Questions that already exist are skipped and only
+    # the newly created rows come back.
+    if not questions:
+        return []
+    
+    now = datetime.utcnow()
+    rows = {}
+    for q in questions:
+        rows.setdefault(q.question_text, {
+            "question_text": q.question_text,
+            "answer": q.answer,
+            "type": q.type,
+            "topic": meta.topic,
+            "difficulty": meta.difficulty.value,
+            "skill_type": meta.skill_type.value,
+            "managerial_level": meta.managerial_level,
+            "options": q.options if q.type == "mcq" else None,
+            "correct_option": q.correct_option if q.type == "mcq" else None,
+            "created_at": now
+        })
+    
+    stmt = pg_insert(QuestionORM).values(list(rows.values())).on_conflict_do_nothing(
+        index_elements=[QuestionORM.question_text]
+    ).returning(*QuestionORM.__table__.columns)
+    
     async with AsyncSessionLocal() as session:
-        created = []
-        for q in questions:
-            res = await session.execute(
-                async_select(QuestionORM).where(QuestionORM.question_text == q.question_text)
-            )
-            if res.scalars().first():
-                continue
-            
-            db_q = QuestionORM(
-                question_text=q.question_text,
-                answer=q.answer,
-                type="mcq",
-                topic=meta.topic,
-                difficulty=meta.difficulty.value,
-                skill_type=meta.skill_type.value,
-                managerial_level=meta.managerial_level,
-                options=q.options,
-                correct_option=q.correct_option,
-                created_at=datetime.utcnow()
-            )
-            session.add(db_q)
-            created.append(db_q)
-        
+        result = await session.execute(async_select(QuestionORM).from_statement(stmt))
+        created = result.scalars().all()
         await session.commit()
+    
+    question_bank_cache.add(created)
+    if QUESTION_SIMILARITY_ENABLED:
         for q in created:
-            await session.refresh(q)
-        return created
+            question_similarity_index.add(q.id, q.question_text)
+    return created
 
-async def save_subjective_questions_to_db(questions: List[SubjectiveQuestionCreate], meta: QuestionBatchRequest):
-    async with AsyncSessionLocal() as session:
-        created = []
-        for q in questions:
-            res = await session.execute(
-                async_select(QuestionORM).where(QuestionORM.question_text == q.question_text)
-            )
-            if res.scalars().first():
-                continue
-            
-            db_q = QuestionORM(
-                question_text=q.question_text,
-                answer=q.answer,
-                type="subjective",
-                topic=meta.topic,
-                difficulty=meta.difficulty.value,
-                skill_type=meta.skill_type.value,
-                managerial_level=meta.managerial_level,
-                options=None,
-                correct_option=None,
-                created_at=datetime.utcnow()
-            )
-            session.add(db_q)
-            created.append(db_q)
+def plan_sub_batches(num_questions: int, question_type: str) -> List[int]:
+    # Splits a request into near-equal sub-batches, each small enough for its
+    # completion to fit in LLM_MAX_TOKENS
+    per_call = items_per_completion(question_type)
+    calls = max(1, math.ceil(num_questions / per_call))
+    size, extra = divmod(num_questions, calls)
+    return [size + (1 if i < extra else 0) for i in range(calls)]
+
+def rotate_avoid_list(avoid: List[str], part: int) -> List[str]:
+    # Gives each concurrent sub-batch a different window of the avoid list,
+    # since a prompt only shows the first AVOID_LIST_LIMIT entries
+    if not avoid:
+        return []
+    start = (part * AVOID_LIST_LIMIT) % len(avoid)
+    return avoid[start:] + avoid[:start]
+
+async def generate_sub_batch(
+    request: QuestionBatchRequest,
+    num_questions: int,
+    avoid_questions: List[str],
+    validate: Callable[[List[dict]], list],
+    semaphore: asyncio.Semaphore
+) -> list:
+    def build_prompt(count: int, accepted: List[str]) -> str:
+        return build_enhanced_prompt(
+            request.topic, 
+            request.difficulty.value, 
+            request.skill_type.value, 
+            request.managerial_level,
+            count, 
+            request.question_type.value, 
+            avoid_questions=accepted + avoid_questions
+        )
+    
+    async with semaphore:
+        return await validate_and_retry_llm_call(
+            build_prompt, num_questions, validate,
+            max_retries=3,
+            question_type=request.question_type.value
+        )
+
+async def generate_questions(request: QuestionBatchRequest) -> List[QuestionORM]:
+    # Large requests are fanned out into concurrent sub-batches sized to the
+    # completion token budget, so wall time is about one sub-batch call. The
+    # merged items are validated and deduplicated together; if they come in
+    # short, the shortfall is requested again with the accepted questions
+    # added to the avoid list.
+    question_type = request.question_type.value
+    sizes = plan_sub_batches(request.num_questions, question_type)
+    recent = await get_recent_question_texts(
+        request.topic, request.skill_type.value, request.managerial_level,
+        n=max(15, AVOID_LIST_LIMIT * len(sizes)),
+        difficulty=request.difficulty.value,
+        question_type=question_type
+    )
+    
+    semaphore = asyncio.Semaphore(max(1, GENERATION_CONCURRENCY))
+    seen = set()
+    batch_index = SimilarityIndex() if QUESTION_SIMILARITY_ENABLED else None
+    # Sub-batches validate against the same seen set and index, so duplicates
+    # across them are rejected as they arrive
+    validate = partial(
+        validate_mcq_batch if question_type == "mcq" else validate_subjective_batch,
+        seen=seen,
+        batch_index=batch_index
+    )
+    valid_qs = []
+    last_error = None
+    
+    for round_number in range(1 + max(0, GENERATION_TOPUP_ROUNDS)):
+        missing = request.num_questions - len(valid_qs)
+        if missing <= 0:
+            break
+        if round_number == 0:
+            avoid = recent
+        else:
+            sizes = plan_sub_batches(missing, question_type)
+            avoid = [q.question_text for q in valid_qs] + recent
+            logger.info(f"Topping up {missing} questions in {len(sizes)} sub-batches")
         
-        await session.commit()
+        results = await asyncio.gather(*[
+            generate_sub_batch(request, size, rotate_avoid_list(avoid, part), validate, semaphore)
+            for part, size in enumerate(sizes)
+        ], return_exceptions=True)
+        
+        accepted = 0
+        for result in results:
+            if isinstance(result, Exception):
+                last_error = result
+                logger.warning(f"Generation sub-batch failed: {result}")
+                continue
+            valid_qs.extend(result)
+            accepted += len(result)
+        logger.info(f"Generation round {round_number + 1}: {accepted} valid questions from {len(sizes)} sub-batches")
+        if not accepted:
+            break
+    
+    valid_qs = valid_qs[:request.num_questions]
+    if not valid_qs:
+        if isinstance(last_error, HTTPException):
+            raise last_error
+        label = "MCQ" if question_type == "mcq" else "subjective"
+        raise HTTPException(
+            status_code=500, 
+            detail=f"No valid {label} questions could be generated. Please try again."
+        )
+    
+    created = await save_questions_to_db(valid_qs, request)
+    logger.info(f"Successfully generated {len(created)} questions")
+    return created
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_sub_batch(
+    request: QuestionBatchRequest,
+    num_questions: int,
+    avoid_questions: List[str],
+    validate: Callable[[List[dict]], list],
+    save: Callable[[list], Awaitable[List[QuestionORM]]],
+    semaphore: asyncio.Semaphore,
+    max_retries: int = 3
+) -> List[str]:
+    # Streaming counterpart of generate_sub_batch: each question is validated
+    # and handed to save() as soon as the LLM closes it. Attempts after the
+    # first ask only for the shortfall, like validate_and_retry_llm_call.
+    # Returns the texts of the questions saved; raises only if none were.
+    question_type = request.question_type.value
+    saved: List[str] = []
+    last_error = None
+    for attempt in range(max_retries):
+        wanted = num_questions - len(saved)
+        if wanted <= 0:
+            break
+        prompt = build_enhanced_prompt(
+            request.topic,
+            request.difficulty.value,
+            request.skill_type.value,
+            request.managerial_level,
+            wanted,
+            question_type,
+            avoid_questions=saved + avoid_questions
+        )
+        parser = JSONScanner()
+        try:
+            async with semaphore:
+                async for chunk in stream_groq_llm(prompt, max_tokens=completion_budget(question_type, wanted)):
+                    for raw in parser.feed(chunk):
+                        if len(saved) >= num_questions:
+                            break
+                        try:
+                            item = json.loads(raw)
+                        except ValueError:
+                            metrics.generation_parse_failures.inc()
+                            continue
+                        valid = validate([item])
+                        if valid:
+                            saved.extend(q.question_text for q in await save(valid))
+            last_error = None
+        except Exception as e:
+            logger.warning(f"Streaming sub-batch attempt {attempt + 1} failed: {e}")
+            last_error = e
+    if not saved and last_error is not None:
+        raise last_error
+    return saved
+
+async def stream_generated_questions(request: QuestionBatchRequest) -> AsyncIterator[str]:
+    # Server-sent events for the streaming generation endpoint. Requests are
+    # fanned out into the same sub-batches and top-up rounds as
+    # generate_questions, streamed concurrently. Every question object is
+    # validated, deduplicated across sub-batches and saved as soon as the LLM
+    # closes it, then pushed as a "question" event; a final "done" event
+    # carries totals.
+    question_type = request.question_type.value
+    sizes = plan_sub_batches(request.num_questions, question_type)
+    semaphore = asyncio.Semaphore(max(1, GENERATION_CONCURRENCY))
+    validate = partial(
+        validate_mcq_batch if question_type == "mcq" else validate_subjective_batch,
+        seen=set(),
+        batch_index=SimilarityIndex() if QUESTION_SIMILARITY_ENABLED else None
+    )
+    events: asyncio.Queue = asyncio.Queue()
+    created_texts: List[str] = []
+    rejected_count = 0
+    last_error = None
+    tasks: List[asyncio.Task] = []
+
+    async def save(valid: list) -> List[QuestionORM]:
+        nonlocal rejected_count
+        created = await save_questions_to_db(valid, request)
+        rejected_count += len(valid) - len(created)
         for q in created:
-            await session.refresh(q)
+            created_texts.append(q.question_text)
+            events.put_nowait(_sse("question", QuestionOut.model_validate(q).model_dump(mode="json")))
         return created
 
+    try:
+        recent = await get_recent_question_texts(
+            request.topic, request.skill_type.value, request.managerial_level,
+            n=max(15, AVOID_LIST_LIMIT * len(sizes)),
+            difficulty=request.difficulty.value,
+            question_type=question_type
+        )
+        for round_number in range(1 + max(0, GENERATION_TOPUP_ROUNDS)):
+            missing = request.num_questions - len(created_texts)
+            if missing <= 0:
+                break
+            if round_number == 0:
+                avoid = recent
+            else:
+                sizes = plan_sub_batches(missing, question_type)
+                avoid = created_texts + recent
+                logger.info(f"Topping up {missing} streamed questions in {len(sizes)} sub-batches")
+
+            before = len(created_texts)
+            tasks = [
+                asyncio.create_task(stream_sub_batch(
+                    request, size, rotate_avoid_list(avoid, part), validate, save, semaphore
+                ))
+                for part, size in enumerate(sizes)
+            ]
+            finished = asyncio.gather(*tasks, return_exceptions=True)
+            finished.add_done_callback(lambda _: events.put_nowait(None))
+            while (event := await events.get()) is not None:
+                yield event
+            for result in finished.result():
+                if isinstance(result, Exception):
+                    last_error = result
+                    logger.warning(f"Streaming generation sub-batch failed: {result}")
+            logger.info(f"Streaming generation round {round_number + 1}: {len(created_texts) - before} questions from {len(sizes)} sub-batches")
+            if len(created_texts) == before:
+                break
+    except Exception as e:
+        logger.error(f"Streaming question generation failed: {e}")
+        last_error = e
+    finally:
+        # The client may disconnect mid-stream
+        for task in tasks:
+            task.cancel()
+
+    if not created_texts and last_error is not None:
+        detail = last_error.detail if isinstance(last_error, HTTPException) else str(last_error)
+        yield _sse("error", {"detail": detail, "created": 0})
+        return
+
+    logger.info(f"Streamed {len(created_texts)}/{request.num_questions} questions ({rejected_count} rejected)")
+    yield _sse("done", {"created": len(created_texts), "requested": request.num_questions, "rejected": rejected_count})
+
+def question_filters(
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    skill_type: Optional[str] = None,
+    managerial_level: Optional[str] = None,
+    question_type: Optional[str] = None
+) -> list:
+    filters = []
+    if topic:
+        filters.append(QuestionORM.topic == topic)
+    if difficulty:
+        filters.append(QuestionORM.difficulty == difficulty)
+    if skill_type:
+        filters.append(QuestionORM.skill_type == skill_type)
+    if managerial_level:
+        filters.append(QuestionORM.managerial_level == managerial_level)
+    if question_type:
+        filters.append(QuestionORM.type == question_type)
+    return filters
+
+async def sample_questions(session, filters: list, k: int) -> List[QuestionORM]:
+    # Picks up to QUESTION_SAMPLE_PIVOTS random pivots on the indexed sample_key
+    # column and reads the next matching rows after each, k * QUESTION_SAMPLE_OVERSAMPLE
+    # in total, in one UNION ALL statement; then samples k of them. Spreading
+    # the read over several pivots keeps quizzes from being runs of neighbouring
+    # rows and keeps two quizzes with nearby pivots from mostly overlapping.
+    # Each read is an index range scan instead of ORDER BY random(), which has
+    # to sort every matching row. If the windows run past the end of the key
+    # range, the shortfall is read from its start.
+    # Filters that are a prefix of ix_questions_bucket_sample_key's columns
+    # with all four set read about k rows; partial or non-indexed filters
+    # (no difficulty or type, managerial level) walk the sample_key index and
+    # discard non-matching rows, so they read about window / selectivity rows.
+    # scripts/benchmark_question_sampling.py times each shape.
+    if k <= 0:
+        return []
+    window = k * max(1, QUESTION_SAMPLE_OVERSAMPLE)
+    pivots = sorted(random.random() for _ in range(max(1, min(k, QUESTION_SAMPLE_PIVOTS))))
+    per_pivot = math.ceil(window / len(pivots))
+    probes = [
+        async_select(QuestionORM.id).where(*filters, QuestionORM.sample_key >= pivot)
+        .order_by(QuestionORM.sample_key).limit(per_pivot).subquery()
+        for pivot in pivots
+    ]
+    probed_ids = union_all(*[async_select(probe.c.id) for probe in probes])
+    result = await session.execute(async_select(QuestionORM).where(QuestionORM.id.in_(probed_ids)))
+    rows = list(result.scalars().all())
+    if len(rows) < window:
+        # Rows below the lowest pivot are disjoint from every window
+        result = await session.execute(
+            async_select(QuestionORM).where(*filters, QuestionORM.sample_key < pivots[0])
+            .order_by(QuestionORM.sample_key).limit(window - len(rows))
+        )
+        rows.extend(result.scalars().all())
+    
+    return random.sample(rows, min(k, len(rows)))
+
+async def pick_questions(
+    k: int,
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    skill_type: Optional[str] = None,
+    managerial_level: Optional[str] = None,
+    question_type: Optional[str] = None
+) -> List[QuestionForEvaluation]:
+    if QUESTION_BANK_CACHE_ENABLED:
+        questions = await question_bank_cache.sample(
+            k, topic, difficulty, skill_type, managerial_level, question_type
+        )
+        if questions is not None:
+            return questions
+    
+    filters = question_filters(topic, difficulty, skill_type, managerial_level, question_type)
+    async with ReadSessionLocal() as session:
+        return [to_quiz_question(q) for q in await sample_questions(session, filters, k)]
+
 async def get_quiz_questions(request: QuizRequest) -> List[QuestionForEvaluation]:
     logger.info(f"Starting quiz with {request.num_questions} questions")
+    difficulty = request.difficulty.value if request.difficulty else None
+    question_type = request.question_type.value if request.question_type else None
     
     if request.managerial_level:
         ratios = await get_managerial_ratios(request.managerial_level)
         if ratios:
             soft_skill_ratio = ratios['soft_skill_ratio']
-            technical_ratio = ratios['technical_ratio']
             num_soft = int(round(request.num_questions * soft_skill_ratio / 100))
             num_tech = request.num_questions - num_soft
             
-            async with AsyncSessionLocal() as session:
-                # Get soft skill questions
-                query_soft = async_select(QuestionORM).where(QuestionORM.skill_type == "soft_skill")
-                if request.topic:
-                    query_soft = query_soft.where(QuestionORM.topic == request.topic)
-                if request.difficulty:
-                    query_soft = query_soft.where(QuestionORM.difficulty == request.difficulty.value)
-                if request.question_type:
-                    query_soft = query_soft.where(QuestionORM.type == request.question_type.value)
-                query_soft = query_soft.order_by(QuestionORM.created_at.desc()).limit(num_soft)
-                result_soft = await session.execute(query_soft)
-                soft_questions = result_soft.scalars().all()
-
-                # Get technical questions
-                query_tech = async_select(QuestionORM).where(QuestionORM.skill_type == "technical")
-                if request.topic:
-                    query_tech = query_tech.where(QuestionORM.topic == request.topic)
-                if request.difficulty:
-                    query_tech = query_tech.where(QuestionORM.difficulty == request.difficulty.value)
-                if request.question_type:
-                    query_tech = query_tech.where(QuestionORM.type == request.question_type.value)
-                query_tech = query_tech.order_by(QuestionORM.created_at.desc()).limit(num_tech)
-                result_tech = await session.execute(query_tech)
-                tech_questions = result_tech.scalars().all()
-
-                questions = list(soft_questions) + list(tech_questions)
-                if not questions:
-                    raise HTTPException(status_code=404, detail="No questions found matching the criteria")
-                
-                return [QuestionForEvaluation(
-                    id=q.id,
-                    question_text=q.question_text,
-                    type=q.type,
-                    topic=q.topic,
-                    difficulty=q.difficulty,
-                    skill_type=q.skill_type,
-                    managerial_level=q.managerial_level,
-                    options=q.options if q.type == "mcq" else None
-                ) for q in questions]
+            soft_questions = await pick_questions(
+                num_soft, request.topic, difficulty, "soft_skill", None, question_type
+            )
+            tech_questions = await pick_questions(
+                num_tech, request.topic, difficulty, "technical", None, question_type
+            )
+            
+            questions = soft_questions + tech_questions
+            if not questions:
+                raise HTTPException(status_code=404, detail="No questions found matching the criteria")
+            
+            logger.info(f"Retrieved {len(questions)} randomized questions for quiz (with managerial ratios)")
+            return questions
     
     # Regular query without managerial ratios
-    query = async_select(QuestionORM)
-    if request.topic:
-        query = query.where(QuestionORM.topic == request.topic)
-    if request.difficulty:
-        query = query.where(QuestionORM.difficulty == request.difficulty.value)
-    if request.skill_type:
-        query = query.where(QuestionORM.skill_type == request.skill_type.value)
-    if request.managerial_level:
-        query = query.where(QuestionORM.managerial_level == request.managerial_level)
-    if request.question_type:
-        query = query.where(QuestionORM.type == request.question_type.value)
+    questions = await pick_questions(
+        request.num_questions,
+        request.topic,
+        difficulty,
+        request.skill_type.value if request.skill_type else None,
+        request.managerial_level,
+        question_type
+    )
     
-    query = query.order_by(QuestionORM.created_at.desc()).limit(request.num_questions)
+    if not questions:
+        raise HTTPException(status_code=404, detail="No questions found matching the criteria")
     
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(query)
-        questions = result.scalars().all()
-        
-        if not questions:
-            raise HTTPException(status_code=404, detail="No questions found matching the criteria")
-        
-        return [QuestionForEvaluation(
-            id=q.id,
-            question_text=q.question_text,
-            type=q.type,
-            topic=q.topic,
-            difficulty=q.difficulty,
-            skill_type=q.skill_type,
-            managerial_level=q.managerial_level,
-            options=q.options if q.type == "mcq" else None
-        ) for q in questions]
+    logger.info(f"Retrieved {len(questions)} randomized questions for quiz")
+    return questions
@@ -0,0 +1,226 @@
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Mapping, Optional, Set
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.future import select as async_select
+
+from database import AsyncSessionLocal, DATABASE_URL
+from models import ManagerialRatioORM, ReferenceDataVersionORM
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_DATA_CACHE_ENABLED = os.getenv("REFERENCE_DATA_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# How other workers' changes are picked up: "notify" (LISTEN on REFERENCE_DATA_CHANNEL),
+# "poll" (compare reference_data_versions every REFERENCE_DATA_POLL_INTERVAL) or "off"
+REFERENCE_DATA_REFRESH = os.getenv("REFERENCE_DATA_REFRESH", "notify").lower()
+# Poll period in "poll" mode, and listener connection health check period in "notify" mode
+REFERENCE_DATA_POLL_INTERVAL = int(os.getenv("REFERENCE_DATA_POLL_INTERVAL", "30"))
+# Channel the reference_data_changed() trigger notifies, with the table name as payload
+REFERENCE_DATA_CHANNEL = "reference_data"
+
+MANAGERIAL_RATIOS = ManagerialRatioORM.__tablename__
+
+# Reads a whole table into a mapping of lookup key -> value
+Loader = Callable[[Any], Awaitable[Dict[Hashable, Any]]]
+
+def _asyncpg_dsn() -> str:
+    return make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+
+class ReferenceDataCache:
+    # Small, rarely written lookup tables held in full in every worker. Each
+    # table is registered under its database table name, which is also the
+    # payload of its change notifications and its key in reference_data_versions.
+    def __init__(self):
+        self._loaders: Dict[str, Loader] = {}
+        self._tables: Dict[str, Dict[Hashable, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+        self._lock = asyncio.Lock()
+        # One reload of a table at a time, so a slow reload cannot replace a
+        # newer snapshot with the older data it read
+        self._reload_locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._pending: Set[asyncio.Task] = set()
+
+    def register(self, name: str, loader: Loader):
+        self._loaders[name] = loader
+        self._reload_locks[name] = asyncio.Lock()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._loaders)
+
+    async def start(self):
+        try:
+            await self.reload(trigger="startup")
+        except Exception as e:
+            logger.warning(f"Reference data load failed, tables will load on first use: {e}")
+        if REFERENCE_DATA_REFRESH == "notify":
+            self._tasks.append(asyncio.create_task(self._listen_loop()))
+        elif REFERENCE_DATA_REFRESH == "poll":
+            self._tasks.append(asyncio.create_task(self._poll_loop()))
+        logger.info(f"Reference data cache started with {len(self._loaders)} tables (refresh={REFERENCE_DATA_REFRESH})")
+
+    async def stop(self):
+        for task in self._tasks + list(self._pending):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _read_versions(self, session) -> Dict[str, int]:
+        result = await session.execute(
+            async_select(ReferenceDataVersionORM.name, ReferenceDataVersionORM.version)
+        )
+        return dict(result.all())
+
+    async def reload(self, name: Optional[str] = None, trigger: str = "manual"):
+        # Reload hook: re-reads one table, or all of them, from the primary so a
+        # reload right after a notification sees the change. Reloads of a table
+        # (notifications, reconnects, polls, manual) run one at a time in the
+        # order they were requested, each reading after the previous one
+        # finished, so the last snapshot stored is always the newest. Versions
+        # are read before the data, so a write landing in between shows up as
+        # a newer version on the next poll rather than being missed.
+        names = [name] if name is not None else self.names
+        names = [n for n in names if n in self._loaders]
+        if not names:
+            return
+        async with AsyncSessionLocal() as session:
+            for n in names:
+                async with self._reload_locks[n]:
+                    versions = await self._read_versions(session)
+                    # Replaced whole, so readers see either the old table or the new one
+                    self._tables[n] = await self._loaders[n](session)
+                    self._versions[n] = versions.get(n, 0)
+                    self._loaded_at[n] = time.time()
+                metrics.reference_data_reloads.inc(table=n, trigger=trigger)
+        logger.info(f"Reloaded reference data ({trigger}): {', '.join(f'{n}={len(self._tables[n])}' for n in names)}")
+
+    async def _ensure_loaded(self, name: str) -> Dict[Hashable, Any]:
+        table = self._tables.get(name)
+        if table is None:
+            if name not in self._loaders:
+                raise KeyError(f"Unknown reference table: {name}")
+            async with self._lock:
+                if name not in self._tables:
+                    await self.reload(name, trigger="first_use")
+            table = self._tables[name]
+        return table
+
+    async def get(self, name: str, key: Hashable, default: Any = None) -> Any:
+        # Returns the cached value itself; callers must copy it before modifying it
+        table = await self._ensure_loaded(name)
+        if key in table:
+            self.hits[name] += 1
+            metrics.reference_data_lookups.inc(table=name, result="hit")
+            return table[key]
+        self.misses[name] += 1
+        metrics.reference_data_lookups.inc(table=name, result="miss")
+        return default
+
+    async def table(self, name: str) -> Mapping[Hashable, Any]:
+        # Whole table, e.g. for listing a catalog; callers must not modify it
+        return await self._ensure_loaded(name)
+
+    async def publish(self, name: str):
+        # Tells every worker that `name` changed: bumps its version for pollers
+        # and notifies listeners, both on commit. For writes made from the app;
+        # the SQL trigger covers writes made directly in the database.
+        now = datetime.utcnow()
+        stmt = pg_insert(ReferenceDataVersionORM).values(name=name, version=1, updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ReferenceDataVersionORM.name],
+            set_={"version": ReferenceDataVersionORM.version + 1, "updated_at": now}
+        )
+        async with AsyncSessionLocal() as session:
+            await session.execute(stmt)
+            await session.execute(text("SELECT pg_notify(:channel, :name)"), {"channel": REFERENCE_DATA_CHANNEL, "name": name})
+            await session.commit()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        if payload not in self._loaders:
+            return
+        task = asyncio.get_running_loop().create_task(self._reload_quietly(payload, "notify"))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _reload_quietly(self, name: Optional[str], trigger: str):
+        try:
+            await self.reload(name, trigger=trigger)
+        except Exception as e:
+            logger.warning(f"Reference data reload ({trigger}) failed: {e}")
+
+    async def _listen_loop(self):
+        # LISTEN needs a dedicated connection outside the pool, on the primary
+        delay = 1.0
+        connected_before = False
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(
+                    _asyncpg_dsn(), server_settings={"application_name": "quiz-backend-reference-data"}
+                )
+                await conn.add_listener(REFERENCE_DATA_CHANNEL, self._on_notify)
+                # Changes committed before LISTEN took effect were never
+                # notified: between the startup load and the first connection,
+                # or while disconnected
+                await self.reload(trigger="reconnect" if connected_before else "listen")
+                connected_before = True
+                delay = 1.0
+                while True:
+                    await asyncio.sleep(REFERENCE_DATA_POLL_INTERVAL)
+                    await asyncio.wait_for(conn.execute("SELECT 1"), timeout=10)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Reference data listener failed, reconnecting in {delay:.0f}s: {e!r}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(REFERENCE_DATA_POLL_INTERVAL)
+            try:
+                async with AsyncSessionLocal() as session:
+                    versions = await self._read_versions(session)
+                for name in self._loaders:
+                    if versions.get(name, 0) != self._versions.get(name):
+                        await self.reload(name, trigger="poll")
+            except Exception as e:
+                logger.warning(f"Reference data version poll failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "rows": len(self._tables[name]) if name in self._tables else None,
+                "version": self._versions.get(name),
+                "loaded_at": datetime.utcfromtimestamp(self._loaded_at[name]).isoformat() if name in self._loaded_at else None,
+                "hits": self.hits[name],
+                "misses": self.misses[name],
+            }
+            for name in self._loaders
+        }
+
+async def _load_managerial_ratios(session) -> Dict[Hashable, Any]:
+    result = await session.execute(async_select(ManagerialRatioORM))
+    return {
+        ratio.managerial_level: {"soft_skill_ratio": ratio.soft_skill_ratio, "technical_ratio": ratio.technical_ratio}
+        for ratio in result.scalars().all()
+    }
+
+reference_data = ReferenceDataCache()
+reference_data.register(MANAGERIAL_RATIOS, _load_managerial_ratios)
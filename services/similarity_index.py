@@ -0,0 +1,200 @@
+import os
+import re
+import zlib
+import asyncio
+import hashlib
+import logging
+from array import array
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.future import select as async_select
+
+from database import AsyncSessionLocal
+from models import QuestionORM
+
+logger = logging.getLogger(__name__)
+
+QUESTION_SIMILARITY_ENABLED = os.getenv("QUESTION_SIMILARITY_ENABLED", "true").lower() in ("1", "true", "yes")
+# Jaccard similarity of two questions' features (content words and adjacent
+# content word pairs) at or above which they count as duplicates. Tuned with
+# scripts/tune_question_similarity.py on its own labelled pairs, not on the
+# ones in tests/test_similarity.py.
+QUESTION_SIMILARITY_THRESHOLD = float(os.getenv("QUESTION_SIMILARITY_THRESHOLD", "0.7"))
+
+# MinHash signature length and LSH banding (BANDS * ROWS == NUM_PERM). With 32
+# bands of 4 rows, a pair at 0.6 similarity shares a bucket with probability
+# 0.99 and one at 0.7 with 0.9998. Candidates are then checked with their
+# exact Jaccard similarity, so the estimate only decides what gets checked.
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+_WORD = re.compile(r"[A-Za-z0-9]+(?:\+\+|#)?")
+# HTTPS, SQL, C++, C#: kept as written, never stemmed
+_TERM = re.compile(r"^[A-Z0-9]{2,}s?$|^[A-Za-z]+(?:\+\+|#)$")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+# Function words and the imperatives questions are phrased with. Words that
+# can change what is asked (before/after, most/least, with/without, not) are
+# content words.
+_STOPWORDS = frozenset("""
+    a an the and or of to in on at by for from as
+    is are was were be been being am do does did have has had
+    will would shall should can could may might must
+    what which who whom whose when where why how that this these those there it its
+    you your we our us i me my they them their
+    describe explain define outline discuss
+""".split())
+
+def normalize_question(text: str) -> str:
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+def _stem(word: str) -> str:
+    # Plurals and third person -s only, so "commits" matches "commit"
+    if len(word) > 4:
+        if word.endswith("ies"):
+            return word[:-3] + "y"
+        if re.search(r"(x|ch|sh|ss|z)es$", word):
+            return word[:-2]
+        if word.endswith("s") and not re.search(r"(ss|us|is)$", word):
+            return word[:-1]
+    return word
+
+def content_words(text: str) -> List[str]:
+    words = []
+    for word in _WORD.findall(text):
+        if _TERM.match(word) and not word.islower():
+            # Plural acronyms ("APIs") match their singular
+            words.append((word[:-1] if word[-1] == "s" and word[:-1].isupper() else word).lower())
+            continue
+        word = word.lower()
+        if word not in _STOPWORDS:
+            words.append(_stem(word))
+    return words
+
+def features(text: str) -> List[str]:
+    # Content words plus each adjacent pair of them, so questions using the
+    # same words in a different order ("list instead of tuple") differ
+    words = content_words(text) or [normalize_question(text)]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+@lru_cache(maxsize=50_000)
+def _feature_hashes(word: str) -> array:
+    # NUM_PERM independent 32-bit hashes of one feature, one per MinHash
+    # position. Cached: question vocabulary is small and repeats heavily.
+    return array("I", hashlib.shake_128(word.encode("utf-8")).digest(4 * NUM_PERM))
+
+class Fingerprint(NamedTuple):
+    # Sorted hashes of the question's features, and their MinHash signature
+    features: array
+    minhash: array
+
+def fingerprint(text: str) -> Fingerprint:
+    unique = set(features(text))
+    hashed = array("I", sorted(zlib.crc32(feature.encode("utf-8")) for feature in unique))
+    minhash = array("I", map(min, zip(*[_feature_hashes(feature) for feature in unique])))
+    return Fingerprint(hashed, minhash)
+
+def similarity(a: Fingerprint, b: Fingerprint) -> float:
+    # Exact Jaccard similarity of the feature sets
+    set_a, set_b = set(a.features), set(b.features)
+    union = len(set_a | set_b)
+    return len(set_a & set_b) / union if union else 1.0
+
+def _band_keys(minhash: array) -> List[int]:
+    return [hash((band, tuple(minhash[band * ROWS:(band + 1) * ROWS]))) for band in range(BANDS)]
+
+def _index_entries(rows) -> List[Tuple[int, array, List[int]]]:
+    return [
+        (question_id, fp.features, _band_keys(fp.minhash))
+        for question_id, fp in ((question_id, fingerprint(text)) for question_id, text in rows)
+    ]
+
+def _log_load_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Question similarity index load failed: {task.exception()}")
+
+class SimilarityIndex:
+    def __init__(self, threshold: float = QUESTION_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        # Feature hashes per question; the MinHash is only needed for banding
+        self._features: Dict[int, array] = {}
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+        self._next_local_id = -1
+        self._load_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def _add(self, question_id: int, features: array, band_keys: List[int]):
+        if question_id in self._features:
+            return
+        self._features[question_id] = features
+        for band, key in enumerate(band_keys):
+            self._bands[band].setdefault(key, []).append(question_id)
+
+    def add(self, question_id: Optional[int], text: str, fp: Optional[Fingerprint] = None):
+        # Questions not yet persisted can be added with question_id=None
+        if question_id is None:
+            question_id = self._next_local_id
+            self._next_local_id -= 1
+        fp = fp if fp is not None else fingerprint(text)
+        self._add(question_id, fp.features, _band_keys(fp.minhash))
+
+    def find_similar(self, text: str, fp: Optional[Fingerprint] = None) -> List[Tuple[int, float]]:
+        fp = fp if fp is not None else fingerprint(text)
+        candidates = set()
+        for band, key in enumerate(_band_keys(fp.minhash)):
+            candidates.update(self._bands[band].get(key, ()))
+        words = set(fp.features)
+        matches = []
+        for question_id in candidates:
+            other = set(self._features[question_id])
+            score = len(words & other) / len(words | other)
+            if score >= self.threshold:
+                matches.append((question_id, score))
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def is_near_duplicate(self, text: str, fp: Optional[Fingerprint] = None) -> bool:
+        return bool(self.find_similar(text, fp))
+
+    async def load(self, chunk_size: int = 5000):
+        # Streams every stored question once. Fingerprints are computed in a
+        # worker thread a chunk at a time, so the event loop keeps serving
+        # requests while a large bank is indexed.
+        loop = asyncio.get_running_loop()
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(
+                async_select(QuestionORM.id, QuestionORM.question_text).execution_options(yield_per=chunk_size)
+            )
+            async for rows in result.partitions(chunk_size):
+                for entry in await loop.run_in_executor(None, _index_entries, [tuple(row) for row in rows]):
+                    self._add(*entry)
+        logger.info(f"Question similarity index built with {len(self)} questions")
+
+    async def start(self):
+        # Builds the index in the background; until it finishes, generated
+        # questions are only checked against the part loaded so far
+        self._load_task = asyncio.create_task(self.load())
+        self._load_task.add_done_callback(_log_load_failure)
+
+    async def stop(self):
+        if self._load_task is not None:
+            self._load_task.cancel()
+            await asyncio.gather(self._load_task, return_exceptions=True)
+            self._load_task = None
+
+def rank_by_redundancy(texts: List[str]) -> List[str]:
+    # Orders texts so the ones most similar to the others come first: these
+    # are the questions the LLM keeps producing, so they are the most useful
+    # to list as "avoid" examples. Ties keep the input order.
+    fps = [fingerprint(text) for text in texts]
+    scores = [
+        sum(similarity(fp, other) for j, other in enumerate(fps) if j != i)
+        for i, fp in enumerate(fps)
+    ]
+    order = sorted(range(len(texts)), key=lambda i: (-scores[i], i))
+    return [texts[i] for i in order]
+
+question_similarity_index = SimilarityIndex()
@@ -0,0 +1,143 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, delete, exists, func, text
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.future import select as async_select
+
+from database import AsyncSessionLocal
+from models import EvaluationORM, UserStatsORM
+
+logger = logging.getLogger(__name__)
+
+MCQ_METHODS = ("exact_match",)
+SUBJECTIVE_METHODS = ("llm_evaluated", "keyword_match", "cache_hit")
+# Number of latest evaluations behind "recent_performance"
+RECENT_WINDOW = 10
+
+async def apply_evaluations_to_user_stats(session, rows: List[dict], created_at: datetime):
+    # Folds newly written evaluation rows into user_stats. Must run inside the
+    # transaction that inserts the rows so the rollup never drifts from them.
+    by_user: Dict[str, List[dict]] = {}
+    for row in rows:
+        if row.get("user_id"):
+            by_user.setdefault(row["user_id"], []).append(row)
+
+    # Sorted so concurrent submissions lock user rows in the same order
+    for user_id in sorted(by_user):
+        user_rows = by_user[user_id]
+        await session.execute(
+            pg_insert(UserStatsORM).values(user_id=user_id, recent_scores=[]).on_conflict_do_nothing()
+        )
+        result = await session.execute(
+            async_select(UserStatsORM).where(UserStatsORM.user_id == user_id).with_for_update()
+        )
+        stats = result.scalars().one()
+
+        for row in user_rows:
+            stats.total_questions += 1
+            stats.total_score += row["score"]
+            if row["evaluation_method"] in MCQ_METHODS:
+                stats.mcq_questions += 1
+                if row["score"] == 1.0:
+                    stats.mcq_correct += 1
+            elif row["evaluation_method"] in SUBJECTIVE_METHODS:
+                stats.subjective_questions += 1
+                stats.subjective_score += row["score"]
+
+        newest_first = [row["score"] for row in reversed(user_rows)]
+        stats.recent_scores = (newest_first + list(stats.recent_scores or []))[:RECENT_WINDOW]
+        if stats.first_attempt is None or created_at < stats.first_attempt:
+            stats.first_attempt = created_at
+        if stats.last_attempt is None or created_at > stats.last_attempt:
+            stats.last_attempt = created_at
+
+def user_stats_response(stats: UserStatsORM) -> dict:
+    average_score = stats.total_score / stats.total_questions
+    subjective_avg = stats.subjective_score / stats.subjective_questions if stats.subjective_questions else 0
+    recent = stats.recent_scores or []
+    recent_avg = sum(recent) / len(recent) if recent else 0
+
+    return {
+        "user_id": stats.user_id,
+        "total_questions_attempted": stats.total_questions,
+        "overall_average_score": round(average_score, 3),
+        "overall_percentage": round(average_score * 100, 1),
+        "mcq_questions": stats.mcq_questions,
+        "mcq_correct": stats.mcq_correct,
+        "mcq_accuracy": round((stats.mcq_correct / stats.mcq_questions) * 100, 1) if stats.mcq_questions else 0,
+        "subjective_questions": stats.subjective_questions,
+        "subjective_average_score": round(subjective_avg, 3),
+        "subjective_percentage": round(subjective_avg * 100, 1),
+        "recent_performance": round(recent_avg * 100, 1),
+        "first_attempt": stats.first_attempt,
+        "last_attempt": stats.last_attempt
+    }
+
+async def rebuild_user_stats(user_id: Optional[str] = None, chunk_size: int = 1000) -> int:
+    # Recomputes the rollup from the evaluations table with SQL aggregates.
+    # Used for the initial backfill and to repair drift, e.g. after questions
+    # (and their evaluations) were deleted. Rows of users left with no
+    # evaluations are deleted. Returns the number of users written.
+    ranked = async_select(
+        EvaluationORM.user_id,
+        EvaluationORM.score,
+        EvaluationORM.evaluation_method,
+        EvaluationORM.created_at,
+        func.row_number().over(
+            partition_by=EvaluationORM.user_id,
+            order_by=(EvaluationORM.created_at.desc(), EvaluationORM.id.desc())
+        ).label("position")
+    ).where(EvaluationORM.user_id.isnot(None))
+    if user_id:
+        ranked = ranked.where(EvaluationORM.user_id == user_id)
+    ranked = ranked.subquery()
+
+    is_mcq = ranked.c.evaluation_method.in_(MCQ_METHODS)
+    is_subjective = ranked.c.evaluation_method.in_(SUBJECTIVE_METHODS)
+    query = async_select(
+        ranked.c.user_id,
+        func.count().label("total_questions"),
+        func.sum(ranked.c.score).label("total_score"),
+        func.count().filter(is_mcq).label("mcq_questions"),
+        func.count().filter(and_(is_mcq, ranked.c.score == 1.0)).label("mcq_correct"),
+        func.count().filter(is_subjective).label("subjective_questions"),
+        func.coalesce(func.sum(ranked.c.score).filter(is_subjective), 0.0).label("subjective_score"),
+        func.array_agg(
+            aggregate_order_by(ranked.c.score, ranked.c.position)
+        ).filter(ranked.c.position <= RECENT_WINDOW).label("recent_scores"),
+        func.min(ranked.c.created_at).label("first_attempt"),
+        func.max(ranked.c.created_at).label("last_attempt"),
+    ).group_by(ranked.c.user_id)
+
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            # Blocks evaluation writers until the rebuild commits. Writers whose
+            # rows are not yet visible here apply their deltas afterwards, so no
+            # submission is lost or counted twice.
+            await session.execute(text("LOCK TABLE user_stats IN EXCLUSIVE MODE"))
+            rows = (await session.execute(query)).mappings().all()
+            for i in range(0, len(rows), chunk_size):
+                stmt = pg_insert(UserStatsORM).values([dict(row) for row in rows[i:i + chunk_size]])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[UserStatsORM.user_id],
+                    set_={
+                        column.name: stmt.excluded[column.name]
+                        for column in UserStatsORM.__table__.columns
+                        if column.name != "user_id"
+                    }
+                )
+                await session.execute(stmt)
+
+            # Users the aggregate no longer covers. A writer whose first
+            # evaluations are not yet visible recreates its row after the lock
+            # is released.
+            stale = delete(UserStatsORM).where(
+                ~exists().where(EvaluationORM.user_id == UserStatsORM.user_id)
+            )
+            if user_id:
+                stale = stale.where(UserStatsORM.user_id == user_id)
+            deleted = (await session.execute(stale.execution_options(synchronize_session=False))).rowcount
+    logger.info(f"Rebuilt statistics rollup for {len(rows)} users, removed {deleted} without evaluations")
+    return len(rows)
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Set
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Share of requests whose spans are exported; trace ids are logged for all of them
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+# "file" appends OTLP/JSON lines to TRACE_FILE; "otlp" posts them to TRACE_OTLP_ENDPOINT
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "quiz-backend")
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+class Trace:
+    def __init__(self, sampled: bool):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+        # Set once the root span has been exported with the spans ended so far
+        self.exported = False
+
+class Span:
+    def __init__(self, name: str, trace: Trace, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, exc: BaseException):
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if not self.trace.sampled:
+                return
+            if self.trace.exported:
+                # Outlived the request, e.g. work done while a streaming
+                # response is sent; exported on its own under the same trace id
+                export(self.trace, [self])
+            else:
+                self.trace.spans.append(self)
+
+class _NoopSpan:
+    # Stands in when tracing is off or the trace is not sampled
+    trace = None
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def record_error(self, exc: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+def current_trace_id() -> Optional[str]:
+    span = _current.get()
+    return span.trace.trace_id if span is not None else None
+
+@contextmanager
+def trace(name: str, **attributes):
+    # Root span for one request. Every request gets a trace id for log
+    # correlation; only sampled ones are exported, together with the spans
+    # ended by then. Spans ending later are exported one by one as they end.
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    root = Span(name, Trace(random.random() < TRACE_SAMPLE_RATE), None, KIND_SERVER, attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        root.end()
+        if root.trace.sampled:
+            export(root.trace)
+            root.trace.exported = True
+
+def start_span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    # Child of the current span that the caller ends explicitly, for hooks
+    # like engine events that cannot wrap the work in a with block
+    parent = _current.get()
+    if parent is None or not parent.trace.sampled:
+        return NOOP_SPAN
+    return Span(name, parent.trace, parent.span_id, kind, attributes)
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    child = start_span(name, kind, **attributes)
+    if child is NOOP_SPAN:
+        yield child
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.record_error(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def to_otlp(trace: Trace, spans: Optional[List[Span]] = None) -> dict:
+    entries = []
+    for s in trace.spans if spans is None else spans:
+        entry = {
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "name": s.name,
+            "kind": s.kind,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": [_attribute(k, v) for k, v in s.attributes.items() if v is not None],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 0},
+        }
+        if s.parent_id:
+            entry["parentSpanId"] = s.parent_id
+        entries.append(entry)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", TRACE_SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": TRACE_SERVICE_NAME}, "spans": entries}],
+        }]
+    }
+
+# Traces exported while the file is being written wait here for the next write;
+# beyond this many they are dropped rather than held in memory
+TRACE_FILE_MAX_PENDING = 10000
+
+_otlp_client: Optional[httpx.AsyncClient] = None
+_pending_exports: Set[asyncio.Task] = set()
+_file_lines: List[str] = []
+_file_writer: Optional[asyncio.Task] = None
+
+async def _post(payload: dict):
+    global _otlp_client
+    if _otlp_client is None:
+        _otlp_client = httpx.AsyncClient(timeout=5)
+    try:
+        resp = await _otlp_client.post(TRACE_OTLP_ENDPOINT, json=payload)
+        if resp.status_code >= 300:
+            logger.warning(f"Trace export rejected with {resp.status_code}")
+    except httpx.HTTPError as e:
+        logger.warning(f"Trace export failed: {e!r}")
+
+def _append_lines(lines: List[str]):
+    with open(TRACE_FILE, "a") as f:
+        f.writelines(lines)
+
+async def _write_file():
+    # Single writer: file I/O runs in a worker thread, one batch at a time,
+    # until no exported traces are left
+    while _file_lines:
+        lines = _file_lines[:]
+        del _file_lines[:]
+        try:
+            await asyncio.to_thread(_append_lines, lines)
+        except OSError as e:
+            logger.warning(f"Trace export to {TRACE_FILE} failed: {e}")
+
+def _track(task: asyncio.Task):
+    _pending_exports.add(task)
+    task.add_done_callback(_pending_exports.discard)
+
+def export(trace: Trace, spans: Optional[List[Span]] = None):
+    global _file_writer
+    payload = to_otlp(trace, spans)
+    loop = asyncio.get_running_loop()
+    if TRACE_EXPORTER == "otlp":
+        _track(loop.create_task(_post(payload)))
+        return
+    if len(_file_lines) >= TRACE_FILE_MAX_PENDING:
+        logger.warning(f"Trace export to {TRACE_FILE} is falling behind, dropping trace {trace.trace_id}")
+        return
+    _file_lines.append(json.dumps(payload) + "\n")
+    if _file_writer is None or _file_writer.done():
+        _file_writer = loop.create_task(_write_file())
+        _track(_file_writer)
+
+async def shutdown():
+    global _otlp_client
+    # Spans ending during the wait may start new exports
+    while _pending_exports:
+        await asyncio.gather(*_pending_exports, return_exceptions=True)
+    if _otlp_client is not None:
+        await _otlp_client.aclose()
+        _otlp_client = None
+
+def _instrument_engine(engine):
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _before_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_spans", []).append(start_span(
+            "db.statement", KIND_CLIENT,
+            **{"db.system": "postgresql", "db.statement": statement[:500], "db.executemany": executemany}
+        ))
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def _after_statement(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def _failed_statement(context):
+        spans = context.connection.info.get("trace_spans") if context.connection is not None else None
+        if spans:
+            failed = spans.pop()
+            failed.record_error(context.original_exception)
+            failed.end()
+
+def instrument_sqlalchemy(*engines):
+    # A client span per SQL statement on each engine and an internal span per session commit
+    for engine in engines:
+        _instrument_engine(engine)
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        session.info["trace_commit"] = start_span("db.commit")
+
+    def _end_commit(session):
+        commit = session.info.pop("trace_commit", None)
+        if commit is not None:
+            commit.end()
+
+    event.listen(Session, "after_commit", _end_commit)
+    event.listen(Session, "after_rollback", _end_commit)
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace_id = current_trace_id()
+        record.trace_prefix = f"[trace={trace_id}] " if trace_id else ""
+        return True
+
+def install_log_filter(fmt: str = "%(levelname)s:%(name)s:%(trace_prefix)s%(message)s"):
+    # Adds the current trace id to every line written by the root handlers
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
+        handler.setFormatter(logging.Formatter(fmt))
@@ -0,0 +1,3 @@
+-- Adds the retry backoff column to an existing generation_jobs table. A queued
+-- job with not_before in the future is not claimed until then.
+ALTER TABLE generation_jobs ADD COLUMN IF NOT EXISTS not_before TIMESTAMP;
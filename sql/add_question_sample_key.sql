@@ -0,0 +1,6 @@
+-- Adds the random sampling key used by /quiz/start/ to an existing questions table.
+-- Every existing row gets its own random() value; the ALTER rewrites the table once.
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS sample_key DOUBLE PRECISION NOT NULL DEFAULT random();
+CREATE INDEX IF NOT EXISTS ix_questions_sample_key ON questions (sample_key);
+CREATE INDEX IF NOT EXISTS ix_questions_bucket_sample_key ON questions (topic, skill_type, difficulty, type, sample_key);
+ANALYZE questions;
@@ -0,0 +1,25 @@
+-- Keeps the in-process reference data caches coherent across workers. Every write to
+-- a reference table bumps its row in reference_data_versions (read by the version poll)
+-- and sends NOTIFY reference_data with the table name as payload (read by listeners).
+-- Both take effect on commit. Add a trigger like managerial_ratios_changed for each new
+-- reference table.
+CREATE TABLE IF NOT EXISTS reference_data_versions (
+    name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION reference_data_changed() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO reference_data_versions (name, version, updated_at) VALUES (TG_TABLE_NAME, 1, NOW())
+    ON CONFLICT (name) DO UPDATE
+    SET version = reference_data_versions.version + 1, updated_at = NOW();
+    PERFORM pg_notify('reference_data', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS managerial_ratios_changed ON managerial_ratios;
+CREATE TRIGGER managerial_ratios_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON managerial_ratios
+FOR EACH STATEMENT EXECUTE FUNCTION reference_data_changed();
@@ -1,7 +1,11 @@
+DROP TABLE IF EXISTS generation_jobs CASCADE;
+DROP TABLE IF EXISTS user_stats CASCADE;
+DROP TABLE IF EXISTS evaluation_cache CASCADE;
 DROP TABLE IF EXISTS evaluations CASCADE;
 DROP TABLE IF EXISTS quiz_attempts CASCADE;
 DROP TABLE IF EXISTS questions CASCADE;
 DROP TABLE IF EXISTS managerial_ratios CASCADE;
+DROP TABLE IF EXISTS reference_data_versions CASCADE;
 
 -- Questions table
 CREATE TABLE questions (
@@ -15,8 +19,11 @@ CREATE TABLE questions (
     managerial_level VARCHAR(50),
     options TEXT[],
     correct_option TEXT,
-    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    sample_key DOUBLE PRECISION NOT NULL DEFAULT random()
 );
+CREATE INDEX ix_questions_sample_key ON questions (sample_key);
+CREATE INDEX ix_questions_bucket_sample_key ON questions (topic, skill_type, difficulty, type, sample_key);
 
 -- Managerial ratios table
 CREATE TABLE managerial_ratios (
@@ -25,6 +32,28 @@ CREATE TABLE managerial_ratios (
     technical_ratio INTEGER NOT NULL CHECK (technical_ratio >= 0 AND technical_ratio <= 100)
 );
 
+-- Reference data change tracking: a version per reference table, bumped and
+-- announced with NOTIFY reference_data by a trigger on each table
+CREATE TABLE reference_data_versions (
+    name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION reference_data_changed() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO reference_data_versions (name, version, updated_at) VALUES (TG_TABLE_NAME, 1, NOW())
+    ON CONFLICT (name) DO UPDATE
+    SET version = reference_data_versions.version + 1, updated_at = NOW();
+    PERFORM pg_notify('reference_data', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER managerial_ratios_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON managerial_ratios
+FOR EACH STATEMENT EXECUTE FUNCTION reference_data_changed();
+
 -- Insert sample managerial level ratios
 INSERT INTO managerial_ratios (managerial_level, soft_skill_ratio, technical_ratio) VALUES
 ('junior', 40, 60),
@@ -59,4 +88,48 @@ CREATE TABLE evaluations (
     evaluation_method VARCHAR(20) NOT NULL,
     user_id VARCHAR(100),
     created_at TIMESTAMP NOT NULL DEFAULT NOW()
-);
\ No newline at end of file
+);
+
+-- Grading cache (subjective answers keyed by question and normalized answer hash)
+CREATE TABLE evaluation_cache (
+    id SERIAL PRIMARY KEY,
+    question_id INTEGER NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+    answer_hash VARCHAR(64) NOT NULL,
+    model_answer_hash VARCHAR(64) NOT NULL,
+    score FLOAT NOT NULL,
+    feedback TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    CONSTRAINT uq_evaluation_cache_key UNIQUE (question_id, answer_hash)
+);
+CREATE INDEX ix_evaluation_cache_created_at ON evaluation_cache (created_at);
+
+-- Per-user statistics rollup, maintained alongside evaluations
+CREATE TABLE user_stats (
+    user_id VARCHAR(100) PRIMARY KEY,
+    total_questions INTEGER NOT NULL DEFAULT 0,
+    total_score FLOAT NOT NULL DEFAULT 0,
+    mcq_questions INTEGER NOT NULL DEFAULT 0,
+    mcq_correct INTEGER NOT NULL DEFAULT 0,
+    subjective_questions INTEGER NOT NULL DEFAULT 0,
+    subjective_score FLOAT NOT NULL DEFAULT 0,
+    recent_scores FLOAT[] NOT NULL DEFAULT '{}',
+    first_attempt TIMESTAMP,
+    last_attempt TIMESTAMP
+);
+
+-- Background question generation jobs
+CREATE TABLE generation_jobs (
+    id VARCHAR(36) PRIMARY KEY,
+    status VARCHAR(20) NOT NULL,
+    source VARCHAR(20) NOT NULL DEFAULT 'api',
+    request JSON NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    question_ids INTEGER[],
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    not_before TIMESTAMP
+);
+CREATE INDEX ix_generation_jobs_status ON generation_jobs (status);
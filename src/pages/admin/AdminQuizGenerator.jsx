@@ -73,7 +73,8 @@ const AdminQuizGenerator = () => {
     setError("");
     setQuestions([]);
     try {
-      const resp = await fetch(`${getBaseURL()}/assessment1/generate_questions_batch/`, {
+      // Questions arrive as server-sent events as soon as each one is saved
+      const resp = await fetch(`${getBaseURL()}/assessment1/generate_questions_batch/stream/`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
@@ -81,9 +82,36 @@ const AdminQuizGenerator = () => {
           managerial_level: form.managerial_level || null,
         }),
       });
-      const result = await resp.json();
-      if (!Array.isArray(result)) throw new Error(result.detail || "Unexpected response");
-      setQuestions(result);
+      if (!resp.ok || !resp.body) {
+        const result = await resp.json().catch(() => ({}));
+        throw new Error(result.detail || "Unexpected response");
+      }
+      const reader = resp.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let received = 0;
+      let streamError = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const block of events) {
+          const event = (block.match(/^event: (.*)$/m) || [])[1];
+          const data = (block.match(/^data: (.*)$/m) || [])[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+          if (event === "question") {
+            received += 1;
+            setQuestions((qs) => [...qs, payload]);
+          } else if (event === "error") {
+            streamError = payload.detail || "Error generating questions.";
+          }
+        }
+      }
+      if (streamError) throw new Error(streamError);
+      if (!received) throw new Error("No valid questions could be generated. Please try again.");
       fetchDbQuestions();
     } catch (err) {
       setError(err.message || "Error generating questions.");
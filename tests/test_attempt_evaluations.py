@@ -0,0 +1,39 @@
+"""Statement counts of the attempt evaluation endpoints, which used to run one
+query per evaluation. Each must run a fixed number of statements however many
+evaluations and attempts it returns."""
+from conftest import add_attempt, add_mcq_questions
+from database import query_budget
+
+def test_single_attempt_runs_one_statement(client, run):
+    questions = run(add_mcq_questions(30))
+    small = run(add_attempt("alice", questions[:2]))
+    large = run(add_attempt("alice", questions))
+
+    for attempt_id, expected in ((small, 2), (large, 30)):
+        with query_budget(1, "/quiz/attempt/{attempt_id}/evaluations") as counter:
+            resp = run(client.get(f"/quiz/attempt/{attempt_id}/evaluations"))
+        assert resp.status_code == 200
+        assert len(resp.json()) == expected
+        assert counter.count == 1
+
+def test_batched_attempts_run_one_statement(client, run):
+    questions = run(add_mcq_questions(30))
+    attempt_ids = [run(add_attempt(f"user-{i}", questions[:i + 1])) for i in range(10)]
+
+    counts = []
+    for ids in (attempt_ids[:1], attempt_ids):
+        with query_budget(1, "/quiz/attempt/evaluations") as counter:
+            resp = run(client.get("/quiz/attempt/evaluations", params={"attempt_ids": ids}))
+        assert resp.status_code == 200
+        assert sorted(int(attempt_id) for attempt_id in resp.json()) == sorted(ids)
+        counts.append(counter.count)
+    assert counts == [1, 1]
+
+def test_batched_attempts_include_empty_attempts(client, run):
+    questions = run(add_mcq_questions(3))
+    attempt_id = run(add_attempt("bob", questions))
+
+    resp = run(client.get("/quiz/attempt/evaluations", params={"attempt_ids": [attempt_id, 999]}))
+    assert resp.status_code == 200
+    assert len(resp.json()[str(attempt_id)]) == 3
+    assert resp.json()["999"] == []
@@ -0,0 +1,50 @@
+"""The routes in DEFAULT_QUERY_BUDGETS stay within their statement budget, and
+their statement count does not depend on how many answers, evaluations or
+attempts a request involves."""
+from conftest import add_attempt, add_mcq_questions
+from database import QUERY_BUDGETS, query_budget
+
+def evaluate_payload(user_id, questions, attempt_id):
+    return {
+        "answers": [{"question_id": q.id, "user_answer": "B", "user_id": user_id} for q in questions],
+        "quiz_attempt_id": attempt_id,
+    }
+
+def test_evaluate_statement_count_is_independent_of_answers(client, run):
+    questions = run(add_mcq_questions(20))
+
+    counts = []
+    for answered in (questions[:2], questions):
+        attempt_id = run(add_attempt("alice", []))
+        with query_budget(QUERY_BUDGETS["/quiz/evaluate/"], "/quiz/evaluate/") as counter:
+            resp = run(client.post("/quiz/evaluate/", json=evaluate_payload("alice", answered, attempt_id)))
+        assert resp.status_code == 200
+        assert resp.json()["quiz_attempt_id"] == attempt_id
+        assert resp.json()["total_questions"] == len(answered)
+        counts.append(counter.count)
+    assert counts[0] == counts[1]
+
+def test_batched_evaluations_within_budget(client, run):
+    questions = run(add_mcq_questions(20))
+    attempt_ids = [run(add_attempt(f"user-{i}", questions[:i + 2])) for i in range(5)]
+
+    with query_budget(QUERY_BUDGETS["/quiz/attempt/evaluations"], "/quiz/attempt/evaluations"):
+        resp = run(client.get("/quiz/attempt/evaluations", params={"attempt_ids": attempt_ids}))
+    assert resp.status_code == 200
+    assert [len(resp.json()[str(a)]) for a in attempt_ids] == [2, 3, 4, 5, 6]
+
+def test_user_reads_within_budget(client, run):
+    questions = run(add_mcq_questions(5))
+    for _ in range(3):
+        attempt_id = run(add_attempt("carol", []))
+        resp = run(client.post("/quiz/evaluate/", json=evaluate_payload("carol", questions, attempt_id)))
+        assert resp.status_code == 200
+
+    with query_budget(QUERY_BUDGETS["/quiz/attempts/{user_id}"], "/quiz/attempts/{user_id}"):
+        resp = run(client.get("/quiz/attempts/carol"))
+    assert resp.status_code == 200
+    assert len(resp.json()) == 3
+
+    with query_budget(QUERY_BUDGETS["/stats/user/{user_id}"], "/stats/user/{user_id}"):
+        resp = run(client.get("/stats/user/carol"))
+    assert resp.status_code == 200
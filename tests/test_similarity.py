@@ -0,0 +1,63 @@
+"""Regression pairs for question deduplication, separate from the pairs
+QUESTION_SIMILARITY_THRESHOLD is tuned on (scripts/question_similarity_pairs.json).
+NEAR_DUPLICATES are rewordings of the kind the LLM produces and must be
+rejected; DISTINCT pairs share most of their words but ask about different
+things and must both be kept."""
+import pytest
+
+from services.similarity_index import (
+    SimilarityIndex, fingerprint, similarity, QUESTION_SIMILARITY_THRESHOLD
+)
+
+NEAR_DUPLICATES = [
+    ("What is the difference between TCP and UDP?",
+     "Explain the difference between TCP and UDP."),
+    ("What are the benefits of unit tests?",
+     "Describe the benefits of unit tests."),
+    ("How would you resolve a conflict between two developers on your team?",
+     "How do you resolve a conflict between two developers on your team?"),
+    ("What is the purpose of an index in a database?",
+     "What is the purpose of indexes in a database?"),
+    ("Which HTTP status code indicates that a resource was not found?",
+     "Which HTTP status code indicates a resource was not found?"),
+    ("What are the advantages of microservices over a monolithic architecture?",
+     "What are the advantages of microservices over monolithic architectures?"),
+    ("How do you communicate a project delay to stakeholders?",
+     "How would you communicate a project delay to your stakeholders?"),
+    ("What is a deadlock and how can it be prevented?",
+     "What is a deadlock, and how can deadlocks be prevented?"),
+]
+
+# Same words, different question: order, a single swapped qualifier or subject
+DISTINCT = [
+    ("What happens before a transaction commits?", "What happens after a transaction commits?"),
+    ("How would you handle a conflict with your subordinate?", "How would you handle a conflict with your peer?"),
+    ("Should you give feedback before or after a meeting?", "Should you give feedback during a meeting?"),
+    ("When would you use a list instead of a tuple?", "When would you use a tuple instead of a list?"),
+    ("What is the most common cause of deadlocks?", "What is the least common cause of deadlocks?"),
+    ("What is the default port used by HTTPS?", "What is the default port used by SSH?"),
+    ("What is a primary key in a relational database?", "What is a foreign key in a relational database?"),
+    ("Which data structure uses FIFO ordering?", "Which data structure uses LIFO ordering?"),
+    ("What are the advantages of microservices?", "What are the disadvantages of microservices?"),
+    ("How would you motivate a team during a difficult project?",
+     "How would you plan the budget for a difficult project?"),
+]
+
+@pytest.mark.parametrize("first, second", NEAR_DUPLICATES)
+def test_rewordings_reach_threshold(first, second):
+    assert similarity(fingerprint(first), fingerprint(second)) >= QUESTION_SIMILARITY_THRESHOLD
+
+@pytest.mark.parametrize("first, second", DISTINCT)
+def test_different_questions_stay_below_threshold(first, second):
+    assert similarity(fingerprint(first), fingerprint(second)) < QUESTION_SIMILARITY_THRESHOLD
+
+def test_index_finds_rewordings_and_only_them():
+    index = SimilarityIndex()
+    stored = [first for first, _ in NEAR_DUPLICATES + DISTINCT]
+    for question_id, text in enumerate(stored):
+        index.add(question_id, text)
+
+    for question_id, (first, second) in enumerate(NEAR_DUPLICATES):
+        assert question_id in [match for match, _ in index.find_similar(second)]
+    for question_id, (first, second) in enumerate(DISTINCT, start=len(NEAR_DUPLICATES)):
+        assert question_id not in [match for match, _ in index.find_similar(second)]
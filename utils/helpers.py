@@ -1,114 +1,199 @@
+import os
 import json
-import re
 import logging
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from utils.tokens import estimate_tokens, completion_budget, prompt_budget
 
 logger = logging.getLogger(__name__)
 
-def fix_common_json_issues(json_str: str) -> str:
-    json_str = re.sub(r',\s*}', '}', json_str)
-    json_str = re.sub(r',\s*]', ']', json_str)
-    json_str = re.sub(r'}\s*{', '},{', json_str)
-    json_str = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', json_str)
-    return json_str
+# Raw control characters LLMs sometimes emit; \t, \n and \r are handled separately
+_CONTROL_CHARS = frozenset(chr(c) for c in [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+# Raw whitespace that is invalid inside a JSON string, with its escaped form
+_STRING_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+_WHITESPACE = frozenset(' \t\n\r')
+# Existing questions listed in a generation prompt's AVOID section
+AVOID_LIST_LIMIT = 5
+# Prompt tokens the AVOID section may use; it is also trimmed to fit the context window
+AVOID_LIST_TOKEN_BUDGET = int(os.getenv("AVOID_LIST_TOKEN_BUDGET", "400"))
 
-def clean_json_response(content: str) -> str:
-    try:
-        # Fixed: properly closed string literals
-        content = re.sub(r'```,', '', content)
-        content = re.sub(r'```', '', content)
-        content = re.sub(r'^[^[{]*', '', content)
-        content = re.sub(r'[^}\]]*$', '', content)
-        
-        start_idx = content.find('[')
-        end_idx = content.rfind(']')
-        
-        if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
-            json_content = content[start_idx:end_idx + 1]
-        else:
-            start_idx = content.find('{')
-            end_idx = content.rfind('}')
-            if start_idx != -1 and end_idx != -1 and start_idx < end_idx:
-                json_content = content[start_idx:end_idx + 1]
-                if json_content.count('{') > 1:
-                    objects = []
-                    current_obj = ""
-                    brace_count = 0
-                    for char in json_content:
-                        current_obj += char
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                try:
-                                    json.loads(current_obj.strip())
-                                    objects.append(current_obj.strip())
-                                    current_obj = ""
-                                except:
-                                    current_obj = ""
-                    if objects:
-                        json_content = '[' + ','.join(objects) + ']'
-                else:
-                    json_content = '[' + json_content + ']'
-            else:
-                raise ValueError(f"No valid JSON structure found in response")
+class JSONScanner:
+    # Single-pass, string-aware scanner for JSON embedded in LLM output.
+    #
+    # Skips prose and markdown fences before the first '[' or '{', then copies
+    # the structure out while repairing it: trailing and leading commas are
+    # dropped, a missing comma between "}{" is inserted, raw control
+    # characters are stripped and raw newlines/tabs inside strings are
+    # escaped. Input is copied in runs, never character by character: each
+    # run is sliced from the chunk once, then joined into its item string and
+    # again into the array string, so a character is copied at most three
+    # times.
+    #
+    # Results:
+    #   objects - every complete item object (top-level objects, or objects
+    #             directly inside the top-level array), already repaired
+    #   array   - the repaired top-level array once its closing ']' is seen
+    #
+    # feed() may be called repeatedly with streamed chunks; it returns the
+    # item objects completed by that chunk.
+    def __init__(self):
+        self.objects: List[str] = []
+        self.array: Optional[str] = None
+        self._out: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._pending_comma = False
+        self._last = ''
+        self._item_start: Optional[int] = None
+        self.array_objects = 0
+        self._done = False
+
+    def feed(self, chunk: str) -> List[str]:
+        completed = []
+        out = self._out
+        stack = self._stack
+        seg = 0
         
-        json_content = fix_common_json_issues(json_content)
+        for i, char in enumerate(chunk):
+            if not stack:
+                if self._done:
+                    break
+                if char == '[' or char == '{':
+                    stack.append(char)
+                    seg = i
+                    self._last = char
+                    self._pending_comma = False
+                    if char == '{':
+                        self._item_start = len(out)
+                    else:
+                        self.array_objects = 0
+                continue
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last = '"'
+                elif char in _STRING_ESCAPES:
+                    out.append(chunk[seg:i])
+                    out.append(_STRING_ESCAPES[char])
+                    seg = i + 1
+                elif char in _CONTROL_CHARS:
+                    out.append(chunk[seg:i])
+                    seg = i + 1
+                continue
+            
+            if char in _WHITESPACE:
+                continue
+            if char in _CONTROL_CHARS or char == ',':
+                out.append(chunk[seg:i])
+                seg = i + 1
+                if char == ',':
+                    self._pending_comma = True
+                continue
+            
+            # A comma is only written once we know it is followed by a value
+            if self._pending_comma:
+                self._pending_comma = False
+                if char != '}' and char != ']' and self._last != '[' and self._last != '{':
+                    out.append(',')
+            elif char == '{' and self._last == '}':
+                out.append(chunk[seg:i])
+                out.append(',')
+                seg = i
+            
+            if char == '"':
+                self._in_string = True
+            elif char == '[' or char == '{':
+                if char == '{' and len(stack) == 1 and stack[0] == '[':
+                    out.append(chunk[seg:i])
+                    seg = i
+                    self._item_start = len(out)
+                stack.append(char)
+            elif char == ']' or char == '}':
+                stack.pop()
+                if char == '}' and self._item_start is not None and (
+                    not stack or (len(stack) == 1 and stack[0] == '[')
+                ):
+                    out.append(chunk[seg:i + 1])
+                    seg = i + 1
+                    item = ''.join(out[self._item_start:])
+                    self._item_start = None
+                    self.objects.append(item)
+                    completed.append(item)
+                    if stack:
+                        self.array_objects += 1
+                    else:
+                        out.clear()
+                elif not stack:
+                    # Top-level array closed. Keep scanning if it held no
+                    # objects, e.g. a "[1]" reference in prose before the data.
+                    out.append(chunk[seg:i + 1])
+                    seg = i + 1
+                    array = ''.join(out)
+                    out.clear()
+                    if self.array_objects or self.array is None:
+                        self.array = array
+                    self._done = self.array_objects > 0
+                    self._item_start = None
+            self._last = char
         
-        try:
-            json.loads(json_content)
-            return json_content.strip()
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON validation failed: {e}")
-            logger.error(f"Problematic JSON: {json_content[:200]}...")
-            raise ValueError(f"Invalid JSON after cleaning: {str(e)}")
+        if stack:
+            out.append(chunk[seg:])
+        return completed
+
+def _is_valid_json(text: str) -> bool:
+    try:
+        json.loads(text)
+        return True
+    except ValueError:
+        return False
+
+def extract_json_array(content: str) -> str:
+    # Returns the response's JSON array as text. When the array is malformed or
+    # truncated, the item objects that do parse are recovered into a new array.
+    scanner = JSONScanner()
+    scanner.feed(content)
+    
+    if scanner.array is not None and scanner.array_objects and _is_valid_json(scanner.array):
+        return scanner.array
+    
+    valid = [obj for obj in scanner.objects if _is_valid_json(obj)]
+    if valid:
+        if scanner.array_objects or len(valid) < len(scanner.objects):
+            logger.warning(f"Recovered {len(valid)}/{len(scanner.objects)} objects from malformed JSON response")
+        return '[' + ','.join(valid) + ']'
+    
+    if scanner.array is not None and _is_valid_json(scanner.array):
+        return scanner.array
+    raise ValueError("No valid JSON structure found in response")
+
+def clean_json_response(content: str) -> str:
+    try:
+        return extract_json_array(content)
     except Exception as e:
         logger.error(f"JSON cleaning failed: {e}")
         logger.error(f"Original content: {content[:200]}...")
         raise ValueError(f"Failed to clean JSON response: {str(e)}")
 
 def clean_evaluation_json_response(content: str) -> str:
-    # Fixed: properly closed string literals
-    content = re.sub(r'```,', '', content)
-    content = re.sub(r'```', '', content)
-    start_idx = content.find('{')
-    end_idx = content.rfind('}')
-    
-    if start_idx == -1 or end_idx == -1 or start_idx >= end_idx:
-        raise ValueError(f"No valid JSON object found in response: {content[:200]}...")
-    
-    json_content = content[start_idx:end_idx + 1]
-    json_content = re.sub(r',\s*}', '}', json_content)
-    return json_content.strip()
+    scanner = JSONScanner()
+    scanner.feed(content)
+    for obj in scanner.objects:
+        if _is_valid_json(obj):
+            return obj
+    raise ValueError(f"No valid JSON object found in response: {content[:200]}...")
 
-def build_enhanced_prompt(
-    topic: str,
-    difficulty: str,
-    skill_type: str,
-    managerial_level: str,
-    num_questions: int,
-    question_type: str,
-    avoid_questions: List[str] = None
-) -> str:
-    mcq_or_subj = "multiple choice questions" if question_type == "mcq" else "subjective questions"
-    prompt = (
-        f"Generate exactly {num_questions} unique {mcq_or_subj} about '{topic}' "
-        f"at {difficulty} level for {skill_type.replace('_', ' ')} skills"
-    )
-    
-    if managerial_level:
-        prompt += f" for managerial level '{managerial_level}'"
-    prompt += ".\n\n"
-    
-    if avoid_questions and avoid_questions:
-        prompt += "AVOID these existing questions (create completely different ones):\n"
-        for idx, q in enumerate(avoid_questions[:5]):
-            prompt += f"{idx+1}. {q}\n"
-        prompt += "\n"
-    
+@lru_cache(maxsize=None)
+def _format_section(question_type: str) -> Tuple[str, int]:
+    # Static output-format instructions with their token estimate, rendered once
     if question_type == "mcq":
-        prompt += """CRITICAL: Return ONLY a valid JSON array. No explanations, no markdown, no extra text.
+        section = """CRITICAL: Return ONLY a valid JSON array. No explanations, no markdown, no extra text.
 
 Format (EXACTLY like this):
 [
@@ -127,7 +212,7 @@ Requirements:
 - Double quotes only
 - Each question must be unique and complete"""
     else:
-        prompt += """CRITICAL: Return ONLY a valid JSON array. No explanations, no markdown, no extra text.
+        section = """CRITICAL: Return ONLY a valid JSON array. No explanations, no markdown, no extra text.
 
 Format (EXACTLY like this):
 [
@@ -144,8 +229,61 @@ Requirements:
 - No trailing commas
 - Double quotes only
 - Each question must be unique"""
+    return section, estimate_tokens(section)
+
+def _avoid_section(avoid_questions: List[str], token_budget: int) -> str:
+    # Lists as many avoid questions as fit in token_budget, up to AVOID_LIST_LIMIT
+    header = "AVOID these existing questions (create completely different ones):\n"
+    used = estimate_tokens(header)
+    lines = []
+    for q in avoid_questions[:AVOID_LIST_LIMIT]:
+        line = f"{len(lines)+1}. {q}\n"
+        cost = estimate_tokens(line)
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    if len(lines) < min(len(avoid_questions), AVOID_LIST_LIMIT):
+        logger.info(f"Avoid list trimmed to {len(lines)} questions to fit the prompt budget")
+    if not lines:
+        return ""
+    return header + "".join(lines) + "\n"
+
+def build_enhanced_prompt(
+    topic: str,
+    difficulty: str,
+    skill_type: str,
+    managerial_level: str,
+    num_questions: int,
+    question_type: str,
+    avoid_questions: List[str] = None
+) -> str:
+    mcq_or_subj = "multiple choice questions" if question_type == "mcq" else "subjective questions"
+    prompt = (
+        f"Generate exactly {num_questions} unique {mcq_or_subj} about '{topic}' "
+        f"at {difficulty} level for {skill_type.replace('_', ' ')} skills"
+    )
+    
+    if managerial_level:
+        prompt += f" for managerial level '{managerial_level}'"
+    prompt += ".\n\n"
+    
+    format_section, format_tokens = _format_section(question_type)
+    if avoid_questions:
+        # Whatever the context window leaves after the completion reservation
+        # and the fixed sections, capped by AVOID_LIST_TOKEN_BUDGET
+        room = prompt_budget(completion_budget(question_type, num_questions)) - estimate_tokens(prompt) - format_tokens
+        prompt += _avoid_section(avoid_questions, min(room, AVOID_LIST_TOKEN_BUDGET))
     
-    return prompt
+    return prompt + format_section
+
+_EVALUATION_CRITERIA = """Consider:
+- Accuracy of key concepts
+- Completeness of the answer  
+- Understanding demonstrated
+- Relevant details included"""
+
+_SCORE_SCALE = "A score between 0.0 and 1.0 (where 1.0 is perfect, 0.8-0.9 is very good, 0.6-0.7 is good, 0.4-0.5 is fair, 0.2-0.3 is poor, 0.0-0.1 is very poor)"
 
 def build_evaluation_prompt(question: str, correct_answer: str, user_answer: str) -> str:
     return f"""
@@ -158,17 +296,39 @@ Correct Answer: {correct_answer}
 User's Answer: {user_answer}
 
 Please evaluate the user's answer and provide:
-1. A score between 0.0 and 1.0 (where 1.0 is perfect, 0.8-0.9 is very good, 0.6-0.7 is good, 0.4-0.5 is fair, 0.2-0.3 is poor, 0.0-0.1 is very poor)
+1. {_SCORE_SCALE}
 2. Brief feedback explaining the score
 
-Consider:
-- Accuracy of key concepts
-- Completeness of the answer  
-- Understanding demonstrated
-- Relevant details included
+{_EVALUATION_CRITERIA}
 
 Return ONLY a JSON object in this exact format:
 {{"score": 0.8, "feedback": "Your feedback here explaining the score and what was good/missing"}}
 
 No explanations, just the JSON object.
 """
+
+def build_batch_evaluation_prompt(items: List[Tuple[str, str, str]]) -> str:
+    answers = ""
+    for idx, (question, correct_answer, user_answer) in enumerate(items, start=1):
+        answers += f"""
+[Item {idx}]
+Question: {question}
+
+Correct Answer: {correct_answer}
+
+User's Answer: {user_answer}
+"""
+    return f"""
+You are an expert evaluator. Evaluate each of the user's answers below independently.
+{answers}
+For every item provide:
+1. {_SCORE_SCALE}
+2. Brief feedback explaining the score
+
+{_EVALUATION_CRITERIA}
+
+Return ONLY a JSON array with exactly one object per item, using the item number as "id":
+[{{"id": 1, "score": 0.8, "feedback": "Your feedback here explaining the score and what was good/missing"}}]
+
+No explanations, just the JSON array.
+"""
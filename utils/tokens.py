@@ -0,0 +1,38 @@
+import os
+import math
+
+# Local token estimates: about 4 characters per token holds for English text
+# with Llama and GPT tokenizers, which is close enough for budgeting
+CHARS_PER_TOKEN = float(os.getenv("LLM_CHARS_PER_TOKEN", "4"))
+# Prompt plus completion tokens the model accepts
+LLM_CONTEXT_WINDOW = int(os.getenv("LLM_CONTEXT_WINDOW", "8192"))
+# Upper bound on max_tokens for any single request
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "1800"))
+
+# Approximate completion tokens per item for each request type
+COMPLETION_TOKENS_PER_ITEM = {
+    "mcq": int(os.getenv("GENERATION_TOKENS_PER_MCQ", "110")),
+    "subjective": int(os.getenv("GENERATION_TOKENS_PER_SUBJECTIVE", "260")),
+    "grading": int(os.getenv("GRADING_TOKENS_PER_ITEM", "120")),
+}
+# Fixed completion allowance for brackets and stray text around the items
+COMPLETION_OVERHEAD_TOKENS = 32
+# Multiplier on per-item estimates so a slightly verbose answer is not cut off
+COMPLETION_SAFETY_MARGIN = float(os.getenv("LLM_COMPLETION_SAFETY_MARGIN", "1.25"))
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def completion_budget(request_type: str, items: int = 1) -> int:
+    # max_tokens for a request producing `items` items of the given type
+    per_item = COMPLETION_TOKENS_PER_ITEM.get(request_type, COMPLETION_TOKENS_PER_ITEM["subjective"])
+    return min(LLM_MAX_TOKENS, math.ceil(per_item * max(1, items) * COMPLETION_SAFETY_MARGIN) + COMPLETION_OVERHEAD_TOKENS)
+
+def items_per_completion(request_type: str) -> int:
+    # Most items of the given type one request can return within LLM_MAX_TOKENS
+    per_item = COMPLETION_TOKENS_PER_ITEM.get(request_type, COMPLETION_TOKENS_PER_ITEM["subjective"])
+    return max(1, int((LLM_MAX_TOKENS - COMPLETION_OVERHEAD_TOKENS) // (per_item * COMPLETION_SAFETY_MARGIN)))
+
+def prompt_budget(max_tokens: int) -> int:
+    # Prompt tokens left in the context window once the completion is reserved
+    return LLM_CONTEXT_WINDOW - max_tokens